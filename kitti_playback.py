@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+    KITTI Sequence Playback
+
+    Plays a directory of KITTI velodyne '.bin' files in a PyVista
+    BackgroundPlotter. Upcoming frames are read by a thread pool into a
+    bounded prefetch window while the current frame is rendered, and read
+    frames are kept in a least-recently-used cache so that seeking back
+    and forth does not read the files again.
+
+    Author: Jari Honkanen
+
+"""
+
+import glob
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pointcloud import PointCloud
+
+
+def read_kitti_frame(file_name):
+    """ Read KITTI file into a PointCloud object """
+    point_cloud = PointCloud()
+    point_cloud.read_kitti_file(file_name)
+    return point_cloud
+
+
+class KittiPlayback:
+    """ Prefetching, cached playback of a KITTI velodyne sequence """
+
+    def __init__(self, directory, fps = 10.0, prefetch = 8, cache_size = 64, max_workers = 4):
+        """
+        Parameters:
+            directory (string) : Path to the KITTI 'velodyne' directory
+            fps (float) : Target playback frames per second
+            prefetch (int) : Number of frames read ahead of the current frame
+            cache_size (int) : Maximum number of frames kept in memory
+            max_workers (int) : Number of reader threads
+
+        Exceptions:
+            IOError: if the directory has no KITTI files
+        """
+        self.file_names = sorted(glob.glob(os.path.join(directory, "*.bin")))
+        if not self.file_names:
+            print("[ERROR]: No KITTI files in '" + directory + "'")
+            raise IOError
+
+        self.fps = fps
+        self.prefetch = prefetch
+        self.cache_size = max(cache_size, prefetch + 1)
+        self.position = 0
+        self.paused = False
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.last_step = 0.0
+        # Reentrant, done callbacks of finished or cancelled reads run in the calling thread
+        self.lock = threading.RLock()
+        self.executor = ThreadPoolExecutor(max_workers = max_workers)
+
+
+    def __len__(self):
+        return len(self.file_names)
+
+
+    def close(self):
+        """ Stop reader threads """
+        self.executor.shutdown(wait = False, cancel_futures = True)
+
+
+    def _store(self, index, future):
+        """ Move a finished read from the prefetch window into the cache """
+
+        with self.lock:
+            if self.pending.get(index) is not future:
+                return
+            del self.pending[index]
+            if future.cancelled() or future.exception() is not None:
+                return
+            self.cache[index] = future.result()
+            self.cache.move_to_end(index)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last = False)
+
+
+    def _schedule_prefetch(self, index):
+        """ Start reading frames following index that are neither cached nor being read. Call with lock held """
+
+        for ahead in range(index + 1, min(index + 1 + self.prefetch, len(self.file_names))):
+            if ahead in self.cache or ahead in self.pending:
+                continue
+            future = self.executor.submit(read_kitti_frame, self.file_names[ahead])
+            self.pending[ahead] = future
+            future.add_done_callback(lambda done, ahead = ahead: self._store(ahead, done))
+
+        # Reads far from the current position are no longer needed,
+        # cancelled reads are removed by their done callback
+        for (pending_index, future) in list(self.pending.items()):
+            if not index <= pending_index <= index + self.prefetch:
+                future.cancel()
+
+
+    def get_frame(self, index):
+        """
+        Get frame, from the cache, from a prefetch read or read now
+
+        Parameters:
+            index (int) : Frame index
+
+        Returns:
+            PointCloud of the frame
+        """
+        with self.lock:
+            point_cloud = self.cache.get(index)
+            if point_cloud is not None:
+                self.cache.move_to_end(index)
+            future = self.pending.get(index)
+            self._schedule_prefetch(index)
+
+        if point_cloud is not None:
+            return point_cloud
+
+        if future is not None:
+            return future.result()
+
+        point_cloud = read_kitti_frame(self.file_names[index])
+        with self.lock:
+            self.cache[index] = point_cloud
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last = False)
+
+        return point_cloud
+
+
+    def seek(self, index):
+        """ Move playback to frame index """
+        self.position = max(0, min(int(index), len(self.file_names) - 1))
+
+
+    def pause(self):
+        """ Pause playback """
+        self.paused = True
+
+
+    def resume(self):
+        """ Resume playback """
+        self.paused = False
+
+
+    def set_fps(self, fps):
+        """ Set target playback frames per second """
+        self.fps = fps
+
+
+    def step(self):
+        """
+        Get the current frame. The position advances when playback is not
+        paused and the frame interval of the target frame rate has passed
+
+        Returns:
+            (index, PointCloud) of the current frame
+        """
+        now = time.monotonic()
+        if not self.paused and now - self.last_step >= 1.0 / self.fps:
+            if self.last_step > 0.0:
+                self.position = (self.position + 1) % len(self.file_names)
+            self.last_step = now
+
+        index = self.position
+        return (index, self.get_frame(index))
+
+
+    def attach(self, plotter, interval = 10, **kwargs):
+        """
+        Play the sequence in a BackgroundPlotter at the target frame rate
+
+        Parameters:
+            plotter (pyvistaqt.BackgroundPlotter) : Plotter to show the frames in
+            interval (int) : Milliseconds between checks for a new frame
+            kwargs : Additional arguments for add_mesh
+        """
+        import pyvista as pv
+
+        shown = [None]
+
+        def update():
+            (index, point_cloud) = self.step()
+            if index == shown[0]:
+                return
+            mesh = pv.PolyData(point_cloud.points_array)
+            mesh["intensity"] = point_cloud.intensity_array
+            plotter.add_mesh(mesh, name = "kitti_frame", reset_camera = shown[0] is None, **kwargs)
+            shown[0] = index
+
+        plotter.add_callback(update, interval = interval)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("Usage: python kitti_playback.py <KITTI velodyne directory>")
+        sys.exit(1)
+
+    import pyvistaqt as pvqt
+
+    playback = KittiPlayback(sys.argv[1])
+    plotter_bg = pvqt.BackgroundPlotter()
+    playback.attach(plotter_bg, scalars="intensity", point_size=2)
+    plotter_bg.add_key_event("space", lambda: playback.resume() if playback.paused else playback.pause())
+    plotter_bg.add_key_event("Right", lambda: playback.seek(playback.position + 1))
+    plotter_bg.add_key_event("Left", lambda: playback.seek(playback.position - 1))
+    plotter_bg.app.exec_()
+    playback.close()
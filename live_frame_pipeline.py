@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+    Live Frame Pipeline
+
+    Thread-safe producer/consumer pipeline for live updates of a mesh or
+    point cloud shown in a PyVista BackgroundPlotter. Producer threads fill
+    a preallocated back buffer and publish it. The GUI thread copies the
+    latest published frame into the existing VTK arrays in place at a
+    capped frame rate. Frames published faster than that are dropped.
+
+    When only a few points change per frame, producers can publish deltas
+    of changed point indices and values instead. Pending deltas are merged
+    per point, only those points are patched in the VTK arrays and only
+    the arrays that changed are marked as modified, so the update cost
+    follows the number of changed points, not the size of the scene.
+
+    Author: Jari Honkanen
+
+"""
+
+import threading
+import numpy as np
+
+
+class FrameBuffer:
+    """ Preallocated arrays of one frame """
+
+    def __init__(self, num_points, scalars = None, dtype = np.float32, scalars_dtype = np.float64):
+        self.points = np.zeros((num_points, 3), dtype = dtype)
+        self.scalars = {}
+        for name in (scalars or []):
+            self.scalars[name] = np.zeros(num_points, dtype = scalars_dtype)
+
+
+def merge_delta(pending, indices, values):
+    """
+    Merge new values of points into pending values, newer values replace older ones
+
+    Parameters:
+        pending : (indices, values) of the pending values, or None
+        indices : Numpy Array (M,) of point indices
+        values : Numpy Array (M, ...) of new values
+
+    Returns:
+        (indices, values) with every index once
+    """
+    if pending is not None:
+        indices = np.concatenate((pending[0], indices))
+        values = np.concatenate((pending[1], values))
+
+    # Last occurrence of each index
+    last = len(indices) - 1 - np.unique(indices[::-1], return_index = True)[1]
+
+    return (indices[last], values[last])
+
+
+class LiveFramePipeline:
+    """ Double-buffered frame pipeline from producer threads to the GUI thread """
+
+    def __init__(self, num_points, scalars = None, dtype = np.float32, scalars_dtype = np.float64):
+        """
+        Parameters:
+            num_points (int) : Number of points in every frame
+            scalars (list) : Names of point scalar arrays updated with the points
+            dtype : Data type of the point buffers, should match the mesh points
+            scalars_dtype : Data type of the scalar buffers
+        """
+        self.num_points = num_points
+        self.front = FrameBuffer(num_points, scalars, dtype, scalars_dtype)
+        self.back = FrameBuffer(num_points, scalars, dtype, scalars_dtype)
+        self.lock = threading.Lock()
+        self.pending = False
+        # Pending deltas as (indices, values), at most one value per point
+        self.delta_points = None
+        self.delta_scalars = {}
+        self.frames_published = 0
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+        self.deltas_published = 0
+        self.values_patched = 0
+
+
+    def get_back_buffer(self):
+        """
+        Get buffer for the producer to fill with the next frame
+
+        Only one producer may fill the back buffer at a time. The buffer
+        must not be used after publish().
+
+        Returns:
+            FrameBuffer with 'points' and 'scalars' arrays
+        """
+        return self.back
+
+
+    def publish(self):
+        """ Publish the filled back buffer as the latest frame """
+
+        with self.lock:
+            (self.front, self.back) = (self.back, self.front)
+            if self.pending:
+                # Previous frame was never shown
+                self.frames_dropped += 1
+            self.pending = True
+            # The full frame replaces all earlier deltas
+            self.delta_points = None
+            self.delta_scalars = {}
+            self.frames_published += 1
+
+
+    def publish_delta(self, indices, points = None, scalars = None):
+        """
+        Publish new values of changed points only
+
+        Deltas are applied after the latest full frame. Deltas published
+        before the GUI thread applies them are merged, the newest value of
+        each point is kept, so pending deltas never hold more than one
+        frame of values. The arrays are copied, so the caller may reuse them.
+
+        Parameters:
+            indices : Numpy Array (M,) of indices of the changed points, the
+                last value of a repeated index is used
+            points : Numpy Array (M, 3) of new point coordinates, None to keep the points
+            scalars (dict) : Numpy Arrays (M,) of new scalar values by name,
+                names must be among the pipeline scalars
+
+        Exceptions:
+            ValueError: invalid input parameter
+        """
+        indices = np.array(indices, dtype = np.intp).ravel()
+        if len(indices) > 0 and (np.min(indices) < 0 or np.max(indices) >= self.num_points):
+            raise ValueError("indices must be between 0 and " + str(self.num_points - 1))
+
+        if points is not None:
+            points = np.array(points, dtype = self.front.points.dtype)
+            if points.shape != (len(indices), 3):
+                raise ValueError("points must be an (M, 3) array for M indices")
+
+        delta_scalars = {}
+        for (name, values) in (scalars or {}).items():
+            if name not in self.front.scalars:
+                raise ValueError("Unknown scalars '" + name + "'")
+            values = np.array(values, dtype = self.front.scalars[name].dtype).ravel()
+            if len(values) != len(indices):
+                raise ValueError("scalars '" + name + "' must have one value per index")
+            delta_scalars[name] = values
+
+        with self.lock:
+            if points is not None:
+                self.delta_points = merge_delta(self.delta_points, indices, points)
+            for (name, values) in delta_scalars.items():
+                self.delta_scalars[name] = merge_delta(self.delta_scalars.get(name), indices, values)
+            self.deltas_published += 1
+
+
+    def update_mesh(self, mesh):
+        """
+        Copy the latest frame into the mesh arrays in place. Call from the GUI thread
+
+        Parameters:
+            mesh (pyvista.DataSet) : Mesh with the same number of points and the scalar arrays
+
+        Returns:
+            True if the mesh was updated, False if there was no new frame or delta
+        """
+        points_modified = False
+        modified_scalars = set()
+        with self.lock:
+            if not self.pending and self.delta_points is None and not self.delta_scalars:
+                return False
+            if self.pending:
+                np.copyto(mesh.points, self.front.points, casting = "same_kind")
+                for (name, values) in self.front.scalars.items():
+                    np.copyto(mesh[name], values, casting = "same_kind")
+                points_modified = True
+                modified_scalars.update(self.front.scalars)
+                self.pending = False
+            # Deltas are owned by the pipeline, they can be applied without the lock
+            (delta_points, self.delta_points) = (self.delta_points, None)
+            (delta_scalars, self.delta_scalars) = (self.delta_scalars, {})
+            self.frames_rendered += 1
+
+        # Patch only the changed points, through plain NumPy views of the VTK arrays
+        if delta_points is not None:
+            np.asarray(mesh.points)[delta_points[0]] = delta_points[1]
+            points_modified = True
+            self.values_patched += len(delta_points[0])
+        for (name, (indices, values)) in delta_scalars.items():
+            np.asarray(mesh[name])[indices] = values
+            modified_scalars.add(name)
+            self.values_patched += len(indices)
+
+        # Only the changed VTK arrays are marked as modified
+        if points_modified:
+            mesh.GetPoints().Modified()
+        for name in modified_scalars:
+            mesh.GetPointData().GetArray(name).Modified()
+
+        return True
+
+
+    def attach(self, plotter, mesh, max_fps = 30):
+        """
+        Update mesh from the pipeline in the plotter GUI thread at most max_fps times per second
+
+        Parameters:
+            plotter (pyvistaqt.BackgroundPlotter) : Plotter showing the mesh
+            mesh (pyvista.DataSet) : Mesh to be updated
+            max_fps (float) : Maximum number of frames per second
+        """
+        def update():
+            if self.update_mesh(mesh):
+                plotter.render()
+
+        plotter.add_callback(update, interval = max(1, int(1000 / max_fps)))
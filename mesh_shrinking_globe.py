@@ -12,6 +12,7 @@ from threading import Thread
 import pyvista as pv
 import pyvistaqt as pvqt
 from pyvista import examples
+from live_frame_pipeline import LiveFramePipeline
 
 if __name__ == "__main__":
 
@@ -24,11 +25,21 @@ if __name__ == "__main__":
     plotter_bg.add_mesh(globe, scalars='scalars', lighting=False, show_edges=True, texture=True)
     plotter_bg.view_isometric()
 
+    # Frames are produced in the background and shown by the GUI thread
+    pipeline = LiveFramePipeline(globe.n_points, scalars=['scalars'], dtype=globe.points.dtype)
+    pipeline.attach(plotter_bg, globe, max_fps=30)
+    initial_points = globe.points.copy()
+    rng = np.random.default_rng()
+
     # Change globe size in the background
     def change_size():
+        scale = 1.0
         for i in range(50):
-            globe.points *= 0.95
-            globe.point_arrays['scalars'] = np.random.rand(globe.n_points)
+            scale *= 0.95
+            frame = pipeline.get_back_buffer()
+            np.multiply(initial_points, scale, out=frame.points)
+            rng.random(out=frame.scalars['scalars'])
+            pipeline.publish()
             time.sleep(0.5)
 
     thread = Thread(target=change_size)
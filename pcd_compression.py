@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+    LZF compression used by 'binary_compressed' PCD files
+
+    Uses the C implementation from the 'lzf' package (python-lzf, see
+    requirements.txt). Without it a pure Python implementation is used,
+    which is only fast enough for small data, so larger data raises an
+    ImportError.
+
+    Author: Jari Honkanen
+
+"""
+
+import warnings
+
+try:
+    import lzf
+except ImportError:
+    lzf = None
+
+# LZF format limits
+MAX_LITERAL = 32
+MAX_OFFSET = 8192
+MAX_MATCH = 264
+
+# Largest uncompressed size handled by the pure Python implementation,
+# which compresses about 1 MB/s and decompresses about 30 MB/s
+MAX_FALLBACK_BYTES = 1 << 20
+
+
+def check_fallback(size):
+    """
+    Check that the pure Python implementation can handle data of a size
+
+    Exceptions:
+        ImportError: if the data is larger than MAX_FALLBACK_BYTES
+    """
+    if size > MAX_FALLBACK_BYTES:
+        raise ImportError("The 'lzf' package (python-lzf) is required for LZF data larger than "
+            + str(MAX_FALLBACK_BYTES) + " bytes")
+    warnings.warn("The 'lzf' package (python-lzf) is not installed, using slow pure Python LZF",
+        RuntimeWarning, stacklevel = 3)
+
+
+def lzf_decompress(data, uncompressed_size):
+    """
+    Decompress LZF compressed data
+
+    Parameters:
+        data (bytes) : LZF compressed data
+        uncompressed_size (int) : Size of the decompressed data in bytes
+
+    Returns:
+        output (bytes) : Decompressed data
+
+    Exceptions:
+        ValueError: if the compressed data is corrupt
+        ImportError: if python-lzf is not installed and the data is large
+    """
+    if lzf is not None:
+        output = lzf.decompress(bytes(data), uncompressed_size)
+        if output is None or len(output) != uncompressed_size:
+            raise ValueError("LZF decompression failed")
+        return output
+
+    check_fallback(uncompressed_size)
+
+    data = memoryview(data)
+    output = bytearray()
+    i = 0
+    data_size = len(data)
+
+    while i < data_size:
+        ctrl = data[i]
+        i += 1
+
+        if ctrl < MAX_LITERAL:
+            # Literal run of ctrl + 1 bytes
+            length = ctrl + 1
+            output += data[i:i + length]
+            i += length
+            continue
+
+        # Back reference
+        length = ctrl >> 5
+        if length == 7:
+            length += data[i]
+            i += 1
+        length += 2
+        ref = len(output) - ((ctrl & 0x1f) << 8) - data[i] - 1
+        i += 1
+
+        if ref < 0:
+            raise ValueError("LZF decompression failed: invalid back reference")
+
+        if ref + length <= len(output):
+            output += output[ref:ref + length]
+        else:
+            # Overlapping reference repeats the last 'period' bytes
+            period = output[ref:]
+            repeat = length // len(period) + 1
+            output += (period * repeat)[:length]
+
+    if len(output) != uncompressed_size:
+        raise ValueError("LZF decompression failed: size mismatch")
+
+    return bytes(output)
+
+
+def lzf_compress(data):
+    """
+    Compress data using LZF
+
+    Parameters:
+        data (bytes) : Data to be compressed
+
+    Returns:
+        output (bytes) : LZF compressed data
+
+    Exceptions:
+        ImportError: if python-lzf is not installed and the data is large
+    """
+    if lzf is not None and len(data) > 0:
+        # Output buffer large enough for incompressible input
+        output = lzf.compress(bytes(data), len(data) + len(data) // MAX_LITERAL + 16)
+        if output is not None:
+            return output
+
+    if lzf is None and len(data) > 0:
+        check_fallback(len(data))
+
+    data = bytes(data)
+    data_size = len(data)
+    output = bytearray()
+    literals = bytearray()
+    table = {}
+    i = 0
+
+    def flush_literals():
+        if literals:
+            output.append(len(literals) - 1)
+            output.extend(literals)
+            literals.clear()
+
+    while i < data_size - 2:
+        key = data[i:i + 3]
+        ref = table.get(key)
+        table[key] = i
+
+        if ref is not None and i - ref <= MAX_OFFSET:
+            offset = i - ref - 1
+            max_length = min(MAX_MATCH, data_size - i)
+            length = 3
+            while length < max_length and data[ref + length] == data[i + length]:
+                length += 1
+
+            flush_literals()
+            code_length = length - 2
+            if code_length < 7:
+                output.append((code_length << 5) | (offset >> 8))
+            else:
+                output.append((7 << 5) | (offset >> 8))
+                output.append(code_length - 7)
+            output.append(offset & 0xff)
+            i += length
+            continue
+
+        literals.append(data[i])
+        if len(literals) == MAX_LITERAL:
+            flush_literals()
+        i += 1
+
+    for byte in data[i:]:
+        literals.append(byte)
+        if len(literals) == MAX_LITERAL:
+            flush_literals()
+    flush_literals()
+
+    return bytes(output)
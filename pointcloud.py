@@ -7,12 +7,122 @@
 	Author: Jari Honkanen
 
 """
+import glob
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import numpy.lib.recfunctions as rfn
+from pcd_compression import lzf_compress, lzf_decompress
+from pointcloud_metrics import active_collectors, start_metrics
+from pointcloud_quantization import DequantizedView, get_quantization, quantize_values
+from pointcloud_index import VoxelGridIndex
 
 # point types
 unsigned_types = { 1: np.uint8, 2: np.uint16, 4: np.uint32 }
 signed_types = { 1: np.int8, 2: np.int16, 4: np.int32 }
 float_types = { 4: np.float32, 8: np.float64 }
+pcd_type_codes = { "u": "U", "i": "I", "f": "F" }
+pcd_types = { "U": unsigned_types, "I": signed_types, "F": float_types }
+
+# Number of rows formatted per write when writing ASCII files
+ASCII_CHUNK_POINTS = 65536
+
+# Size of the blocks of ASCII data parsed in parallel when reading ASCII files
+ASCII_BLOCK_BYTES = 1 << 24
+
+# Minimum number of threads for parallel ASCII parsing. A single parsing
+# thread is about half as fast as np.loadtxt, which holds the GIL
+ASCII_MIN_WORKERS = 3
+
+
+def create_point_dtype(fields, sizes, types, counts):
+    """
+    Create NumPy structured data type of a point from PCD header fields
+
+    Parameters:
+        fields (list) : Field names ('FIELDS')
+        sizes (list) : Field sizes in bytes ('SIZE')
+        types (list) : Field types 'F', 'U' or 'I' ('TYPE')
+        counts (list) : Number of values in each field ('COUNT')
+
+    Returns:
+        Packed numpy structured dtype
+
+    Exceptions:
+        TypeError: if a field type or size is not recognized
+    """
+    dtype_fields = []
+    names = set()
+    for (name, size, field_type, count) in zip(fields, sizes, types, counts):
+        try:
+            field_dtype = pcd_types[field_type.upper()][int(size)]
+        except KeyError:
+            print("[ERROR] Invalid 'TYPE' field in the PCD file: " + field_type + " " + str(size))
+            raise TypeError
+
+        # Repeated names (such as '_' padding) need to be unique
+        unique_name = name
+        index = 1
+        while unique_name in names:
+            unique_name = name + "_" + str(index)
+            index += 1
+        names.add(unique_name)
+
+        if int(count) == 1:
+            dtype_fields.append((unique_name, field_dtype))
+        else:
+            dtype_fields.append((unique_name, field_dtype, (int(count),)))
+
+    return np.dtype(dtype_fields)
+
+
+def get_common_type(dtype):
+    """ Return the type shared by all fields of a structured dtype, None for mixed types """
+
+    base_types = set(dtype.fields[name][0].base for name in dtype.names)
+    if len(base_types) == 1:
+        return base_types.pop().type
+
+    return None
+
+
+def get_pcd_field_info(dtype):
+    """
+    Get PCD header field information of a structured point dtype
+
+    Parameters:
+        dtype (numpy dtype) : Structured data type of a point
+
+    Returns:
+        (sizes, types, counts) : Lists of 'SIZE', 'TYPE' and 'COUNT' values
+    """
+    sizes = []
+    types = []
+    counts = []
+    for name in dtype.names:
+        field_dtype = dtype.fields[name][0]
+        sizes.append(field_dtype.base.itemsize)
+        types.append(pcd_type_codes[field_dtype.base.kind])
+        counts.append(field_dtype.itemsize // field_dtype.base.itemsize)
+
+    return (sizes, types, counts)
+
+
+def get_line_value_counts(block, num_lines):
+    """ Return number of whitespace separated values on each line of a block of ASCII rows """
+
+    text = np.frombuffer(block, dtype = np.uint8)
+    newline = text == ord("\n")
+    separator = newline | (text == ord(" ")) | (text == ord("\t")) | (text == ord("\r"))
+    # A value starts where a separator, or the start of the block, is followed by another character
+    starts = ~separator
+    starts[1:] &= separator[:-1]
+    # Number of value starts before each line end
+    line_ends = np.searchsorted(np.flatnonzero(starts), np.flatnonzero(newline))
+    counts = np.diff(np.r_[0, line_ends, np.count_nonzero(starts)])
+
+    return counts[:num_lines]
 
 
 class PointCloud:
@@ -30,24 +140,137 @@ class PointCloud:
         self.viewpoint = ""
         self.num_points = 0
         self.num_fields = 0
+        self.intensity_array = []
+        self.fields = []
+        self.point_dtype = None
+        self.points_structured = []
+        # Scale and offset of quantized fields, {name: (scale, offset)}
+        self.quantization = None
+        self.spatial_index = None
+        self.spatial_index_points = None
 
 
-    def read_pcd_file(self, file_name, bPrint = False):
+    def read_pcd_file(self, file_name, bPrint = False, memory_map = False, max_workers = None,
+            lazy_dequantize = False):
         """
-        Read and parse PCD file (both Binary and ASCII files are supported)
+        Read and parse PCD file (Binary, Binary compressed and ASCII files are supported)
 
         Parameters:
             file_name (string): Name and Path to the PCD file to be read
             bPrint (bool) : Debug print
+            memory_map (bool) : Map BINARY data with np.memmap instead of reading it.
+                The point arrays are then read-only views into the file and
+                nothing is copied into RAM until the data is accessed
+            max_workers (int) : Number of threads parsing ASCII data, None for the number
+                of CPUs. ASCII data is parsed in one thread with fewer than ASCII_MIN_WORKERS
+            lazy_dequantize (bool) : Return quantized x, y, z and intensity as
+                DequantizedView objects that dequantize on access, instead of float32 arrays
 
         Returns:
-            self.points_array : Numpy Array of the point cloud data
+            self.points_array : Numpy Array of the point cloud data (x, y, z)
+
+        Exceptions:
+            IOError: if input file cannot be read
+            TypeError:  if datatype in PCD file is not recognized or the
+                number of ASCII rows does not match 'POINTS'
+            ValueError: if ASCII data cannot be parsed
+        """
+        metrics = start_metrics("read_pcd_file", file_name) if active_collectors else None
+
+        try:
+            try:
+                f = open(file_name, "rb")
+
+            except:
+                print("[ERROR]: Could not open file '" + file_name + "'")
+                raise IOError
+
+            self.read_pcd_header(f, bPrint)
+            if metrics is not None:
+                metrics.end_header()
+
+            self.points_array = []
+
+            # read ASCII data
+            if self.file_type == "ASCII":
+                self.points_structured = self._read_ascii_data(f, max_workers)
+
+            elif self.file_type == "BINARY" and memory_map:
+                # Map data section directly, starting where the header ends
+                data_offset = f.tell()
+                self.points_structured = np.memmap(file_name, dtype = self.point_dtype, mode = "r",
+                    offset = data_offset, shape = (self.num_points,))
+
+            elif self.file_type == "BINARY":
+                self.points_structured = np.fromfile(f, dtype = self.point_dtype, count = self.num_points)
+
+            elif self.file_type == "BINARY_COMPRESSED":
+                self.points_structured = self._read_compressed_data(f)
+
+            else:
+                print("[ERROR] Invalid 'DATA' field in the PCD file: " + self.file_type)
+                raise TypeError
+
+            if metrics is not None:
+                # Mapped data is neither read nor decoded here
+                metrics.bytes_read = f.tell()
+                if not memory_map or self.file_type != "BINARY":
+                    metrics.points_decoded = len(self.points_structured)
+                if self.file_type == "BINARY_COMPRESSED":
+                    metrics.copies += 1
+
+            f.close()
+
+            self.set_structured_points(self.points_structured, self.quantization, lazy_dequantize)
+
+            if metrics is not None:
+                metrics.file_type = self.file_type
+                if (not isinstance(self.points_array, DequantizedView)
+                        and not np.may_share_memory(self.points_array, self.points_structured)):
+                    metrics.copies += 1
+                metrics.end_payload()
+
+            return self.points_array
+
+        except Exception as error:
+            if metrics is not None:
+                metrics.error = repr(error)
+            raise
+
+        finally:
+            if metrics is not None:
+                metrics.finish()
+
+
+    def iter_pcd_chunks(self, file_name, chunk_points = 1000000, structured = False, bPrint = False):
+        """
+        Iterate over a PCD file in fixed size blocks of points without reading the whole file
+
+        Binary and ASCII data are streamed from the file. Binary compressed data
+        has to be decompressed as a whole and is then returned in blocks.
+
+        Parameters:
+            file_name (string): Name and Path to the PCD file to be read
+            chunk_points (int) : Number of points in each block
+            structured (bool) : Return blocks as structured arrays with named fields
+            bPrint (bool) : Debug print
+
+        Returns:
+            (offset, points) : Generator of global index of the first point in
+                the block and Numpy Array of the block with all fields, in the
+                layout of points_array_full after read_pcd_file. Quantized
+                fields are returned as stored, see probe_point_cloud_file
 
         Exceptions:
             IOError: if input file cannot be read
             TypeError:  if datatype in PCD file is not recognized
+            ValueError: invalid input parameter
         """
-        
+        if chunk_points < 1:
+            raise ValueError("chunk_points must be positive")
+
+        metrics = start_metrics("iter_pcd_chunks", file_name) if active_collectors else None
+
         try:
             f = open(file_name, "rb")
 
@@ -55,15 +278,450 @@ class PointCloud:
             print("[ERROR]: Could not open file '" + file_name + "'")
             raise IOError
 
+        # Header of this file is kept apart, self is left unchanged
+        header = PointCloud()
+
+        try:
+            header.read_pcd_header(f, bPrint)
+            if metrics is not None:
+                metrics.file_type = header.file_type
+                metrics.end_header()
+
+            if header.file_type not in ("ASCII", "BINARY", "BINARY_COMPRESSED"):
+                print("[ERROR] Invalid 'DATA' field in the PCD file: " + header.file_type)
+                raise TypeError
+
+            if header.file_type == "BINARY_COMPRESSED":
+                points_structured = header._read_compressed_data(f)
+                if metrics is not None:
+                    metrics.copies += 1
+
+            offset = 0
+            while offset < header.num_points:
+                count = min(chunk_points, header.num_points - offset)
+
+                if header.file_type == "ASCII":
+                    lines = list(itertools.islice(f, count))
+                    if not lines:
+                        break
+                    rows = header._parse_ascii_block(b"".join(lines))
+                    chunk = np.empty(len(rows), dtype = header.point_dtype)
+                    header._store_ascii_rows(chunk, rows)
+
+                elif header.file_type == "BINARY":
+                    chunk = np.fromfile(f, dtype = header.point_dtype, count = count)
+                    if chunk.size == 0:
+                        break
+
+                else:
+                    chunk = points_structured[offset:offset + count]
+
+                if metrics is not None:
+                    # Time spent by the consumer between chunks is not payload time
+                    metrics.end_payload()
+                    metrics.points_decoded += len(chunk)
+                    metrics.bytes_read = f.tell()
+
+                if structured:
+                    yield (offset, chunk)
+                else:
+                    yield (offset, header._points_from_structured(chunk))
+                offset += len(chunk)
+
+                if metrics is not None:
+                    metrics.skip_stage()
+
+        except Exception as error:
+            if metrics is not None:
+                metrics.error = repr(error)
+            raise
+
+        finally:
+            f.close()
+            if metrics is not None:
+                metrics.finish()
+
+
+    def _read_ascii_data(self, f, max_workers = None):
+        """
+        Read ASCII PCD data into a structured array
+
+        With enough CPUs the data is read in blocks split on line
+        boundaries. Blocks are parsed in a thread pool, and the parsed rows
+        are copied in file order into an array preallocated for 'POINTS'
+        points. Otherwise the data is parsed with np.loadtxt.
+        """
+        num_cpus = os.cpu_count() or 1
+        max_workers = min(max_workers or num_cpus, num_cpus)
+        if max_workers < ASCII_MIN_WORKERS:
+            points_structured = np.loadtxt(f, dtype = self.point_dtype, ndmin = 1)
+            if len(points_structured) != self.num_points:
+                print("[ERROR] PCD data has " + str(len(points_structured)) + " rows, 'POINTS' is "
+                    + str(self.num_points))
+                raise TypeError
+            return points_structured
+
+        points_structured = np.empty(self.num_points, dtype = self.point_dtype)
+        offset = 0
+
+        def store(rows):
+            nonlocal offset
+            if offset + len(rows) > self.num_points:
+                print("[ERROR] PCD data has more rows than 'POINTS': " + str(self.num_points))
+                raise TypeError
+            self._store_ascii_rows(points_structured[offset:offset + len(rows)], rows)
+            offset += len(rows)
+
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            # Limit blocks in flight, so that memory use does not grow with the file size
+            pending = []
+            remainder = b""
+            while True:
+                block = f.read(ASCII_BLOCK_BYTES)
+                if not block:
+                    if remainder.strip():
+                        pending.append(executor.submit(self._parse_ascii_block, remainder))
+                    break
+                block = remainder + block
+                end = block.rfind(b"\n") + 1
+                remainder = block[end:]
+                if end > 0:
+                    pending.append(executor.submit(self._parse_ascii_block, block[:end]))
+                if len(pending) > 2 * max_workers:
+                    store(pending.pop(0).result())
+
+            for future in pending:
+                store(future.result())
+
+        if offset != self.num_points:
+            print("[ERROR] PCD data has " + str(offset) + " rows, 'POINTS' is " + str(self.num_points))
+            raise TypeError
+
+        return points_structured
+
+
+    def _parse_ascii_block(self, block):
+        """
+        Parse a block of complete ASCII PCD rows
+
+        Returns:
+            Numpy Array (rows, values per row) of float64, or a structured
+            array when the block needs the general parser
+        """
+        (sizes, types, counts) = get_pcd_field_info(self.point_dtype)
+        num_values = sum(counts)
+
+        # 64-bit integers do not fit the float64 fast path
+        if all(field_type == "F" or size < 8 for (size, field_type) in zip(sizes, types)):
+            # np.fromstring releases the GIL while parsing, np.loadtxt does not
+            try:
+                values = np.fromstring(block, dtype = np.float64, sep = " ")
+            except ValueError:
+                values = None
+            # Every line must be one complete row, otherwise use the general parser
+            num_lines = block.count(b"\n") + (not block.endswith(b"\n"))
+            if (values is not None and len(values) == num_lines * num_values
+                    and np.all(get_line_value_counts(block, num_lines) == num_values)):
+                return values.reshape(num_lines, num_values)
+
+        return np.loadtxt(block.splitlines(), dtype = self.point_dtype, ndmin = 1)
+
+
+    def _store_ascii_rows(self, points_structured, rows):
+        """ Copy parsed ASCII rows into a structured array of the same length """
+
+        if rows.dtype.names is not None:
+            points_structured[:] = rows
+            return
+
+        (sizes, types, counts) = get_pcd_field_info(self.point_dtype)
+        column = 0
+        for (name, count) in zip(self.point_dtype.names, counts):
+            field = points_structured[name]
+            field[...] = rows[:, column:column + count].reshape(field.shape)
+            column += count
+
+
+    def _read_compressed_data(self, f):
+        """ Read and decompress binary compressed PCD data into a structured array """
+
+        # Compressed and uncompressed sizes followed by LZF data
+        (compressed_size, uncompressed_size) = np.frombuffer(f.read(8), dtype = np.uint32)
+        data = lzf_decompress(f.read(int(compressed_size)), int(uncompressed_size))
+
+        # Data is stored field by field, copy each field block into place
+        points_structured = np.empty(self.num_points, dtype = self.point_dtype)
+        data_offset = 0
+        for name in self.point_dtype.names:
+            field_dtype = self.point_dtype.fields[name][0]
+            field_data = np.frombuffer(data, dtype = np.uint8, count = self.num_points * field_dtype.itemsize,
+                offset = data_offset)
+            points_structured[name] = field_data.view(field_dtype.base).reshape(points_structured[name].shape)
+            data_offset += self.num_points * field_dtype.itemsize
+
+        return points_structured
+
+
+    def set_structured_points(self, points_structured, quantization = None, lazy_dequantize = False):
+        """
+        Set point cloud data from a structured array with one named field per PCD field
+
+        Parameters:
+            points_structured (numpy structured array) : Point data
+            quantization (dict) : Scale and offset of quantized integer fields,
+                {name: (scale, offset)}. Quantized x, y, z and intensity are
+                dequantized into float32 in points_array and intensity_array
+            lazy_dequantize (bool) : Set quantized points_array and intensity_array
+                as DequantizedView objects that dequantize only the accessed rows
+
+        Returns:
+        """
+        self.points_structured = points_structured
+        self.quantization = quantization
+        self.point_dtype = points_structured.dtype
+        self.point_type = get_common_type(self.point_dtype)
+        self.fields = list(self.point_dtype.names)
+        self.num_fields = len(self.fields)
+        self.num_points = len(points_structured)
+        self.points_array_full = self._points_from_structured(points_structured)
+        self.spatial_index = None
+
+        # x, y, z as a view when the fields share a type, otherwise as a copy
+        if all(name in self.fields for name in ("x", "y", "z")):
+            self.points_array = rfn.structured_to_unstructured(points_structured[["x", "y", "z"]])
+            if quantization and any(name in quantization for name in ("x", "y", "z")):
+                (scales, offsets) = zip(*[quantization.get(name, (1.0, 0.0)) for name in ("x", "y", "z")])
+                self.points_array = DequantizedView(self.points_array, scales, offsets)
+                if not lazy_dequantize:
+                    self.points_array = np.asarray(self.points_array)
+        else:
+            self.points_array = self.points_array_full
+
+        if "intensity" in self.fields:
+            intensity_name = "intensity"
+        elif self.num_fields == 4:
+            intensity_name = self.fields[3]
+        else:
+            intensity_name = None
+
+        if intensity_name is None:
+            self.intensity_array = []
+        elif quantization and intensity_name in quantization:
+            self.intensity_array = DequantizedView(points_structured[intensity_name], *quantization[intensity_name])
+            if not lazy_dequantize:
+                self.intensity_array = np.asarray(self.intensity_array)
+        else:
+            self.intensity_array = points_structured[intensity_name]
+
+
+    def quantize(self, precision = 0.001, coordinate_type = np.int32, intensity_type = np.uint16,
+            intensity_range = None, lazy_dequantize = True):
+        """
+        Store x, y, z and intensity as quantized integers with a scale and offset
+
+        Coordinates are stored with the given precision around the middle of
+        their range. Intensity is spread over the whole integer range.
+        Other fields are kept unchanged. Quantized clouds are written to PCD
+        files as integer fields, with the scales and offsets in a
+        '# QUANTIZATION' header comment.
+
+        Parameters:
+            precision (float) : Coordinate quantization step, for example 0.001 for millimeters
+            coordinate_type : np.int16 or np.int32
+            intensity_type : np.uint8 or np.uint16, None to keep intensity unchanged
+            intensity_range : (min, max) of intensity values, for example (0.0, 1.0),
+                None to use the range of the values
+            lazy_dequantize (bool) : Keep the quantized integers as the only copy of the
+                data, with points_array and intensity_array as DequantizedView objects.
+                False to also hold float32 copies in points_array and intensity_array
+
+        Returns:
+            self.quantization : {name: (scale, offset)}
+
+        Exceptions:
+            ValueError: if the coordinates do not fit coordinate_type at the precision
+        """
+        points = self.get_structured_points()
+        quantization = dict(self.quantization or {})
+        targets = {name: coordinate_type for name in ("x", "y", "z") if name in points.dtype.names}
+        if intensity_type is not None and "intensity" in points.dtype.names:
+            targets["intensity"] = intensity_type
+
+        values = {}
+        for (name, quantized_type) in targets.items():
+            field = points[name]
+            if name in quantization:
+                # Already quantized, requantize the real values
+                (scale, offset) = quantization.pop(name)
+                field = field * scale + offset
+            if name == "intensity":
+                (scale, offset) = get_quantization(field, None, quantized_type, intensity_range)
+            else:
+                (scale, offset) = get_quantization(field, precision, quantized_type)
+            values[name] = quantize_values(field, scale, offset, quantized_type)
+            quantization[name] = (scale, offset)
+
+        dtype = np.dtype([(name, values[name].dtype if name in values else points.dtype.fields[name][0])
+            for name in points.dtype.names])
+        points_quantized = np.empty(len(points), dtype = dtype)
+        for name in points.dtype.names:
+            points_quantized[name] = values[name] if name in values else points[name]
+
+        self.set_structured_points(points_quantized, quantization, lazy_dequantize)
+
+        return self.quantization
+
+
+    def dequantize(self):
+        """ Convert quantized fields back to float32 fields """
+
+        if not self.quantization:
+            return
+
+        points = self.get_structured_points()
+        dtype = np.dtype([(name, np.float32 if name in self.quantization else points.dtype.fields[name][0])
+            for name in points.dtype.names])
+        points_dequantized = np.empty(len(points), dtype = dtype)
+        for name in points.dtype.names:
+            if name in self.quantization:
+                (scale, offset) = self.quantization[name]
+                points_dequantized[name] = points[name] * scale + offset
+            else:
+                points_dequantized[name] = points[name]
+
+        self.set_structured_points(points_dequantized)
+
+
+    def get_field(self, name):
+        """
+        Get single field of the point cloud data
+
+        Parameters:
+            name (string) : Name of the field as in the PCD 'FIELDS' line
+
+        Returns:
+            Numpy Array view of the field values, quantized fields as stored
+
+        Exceptions:
+            ValueError: if the field does not exist
+        """
+        if self.point_dtype is None or name not in self.point_dtype.names:
+            raise ValueError("Unknown field: " + str(name))
+
+        return self.points_structured[name]
+
+
+    def get_organized_points(self, name = None):
+        """
+        Get points of an organized point cloud as an image shaped view
+
+        Organized clouds, for example from a spinning LiDAR or a depth
+        camera, store HEIGHT rows of WIDTH points in row-major order.
+
+        Parameters:
+            name (string) : Field name, None for x, y, z of self.points_array,
+                "full" for all fields of self.points_array_full
+
+        Returns:
+            Numpy Array view (HEIGHT, WIDTH, C) of the points, (HEIGHT, WIDTH)
+            for single value fields and structured data. Quantized x, y, z
+            are returned dequantized, as a copy
+
+        Exceptions:
+            ValueError: if the cloud is not organized or the field does not exist
+        """
+        if self.height < 2 or self.width * self.height != self.num_points:
+            raise ValueError("Point cloud is not organized, WIDTH " + str(self.width) + " HEIGHT "
+                + str(self.height) + " POINTS " + str(self.num_points))
+
+        if name is None:
+            points = self.points_array
+        elif name == "full":
+            points = self.points_array_full
+        else:
+            points = self.get_field(name)
+
+        # Splitting the point axis never copies
+        return np.reshape(points, (self.height, self.width) + np.shape(points)[1:])
+
+
+    def get_spatial_index(self, cell_size = None):
+        """
+        Get spatial index of the points for radius and k-nearest-neighbor queries
+
+        The index is built on first use and cached. It is rebuilt when
+        self.points_array is replaced or the cell size changes. Call
+        invalidate_spatial_index() after modifying the points in place.
+
+        Parameters:
+            cell_size (float) : Voxel edge length, None to choose it from the point density
+
+        Returns:
+            VoxelGridIndex over self.points_array
+        """
+        index = self.spatial_index
+        if (index is None or self.spatial_index_points is not self.points_array
+                or (cell_size is not None and cell_size != index.cell_size)):
+            index = VoxelGridIndex(self.points_array, cell_size)
+            self.spatial_index = index
+            self.spatial_index_points = self.points_array
+
+        return index
+
+
+    def invalidate_spatial_index(self):
+        """ Drop cached spatial index, for example after modifying the points in place """
+        self.spatial_index = None
+
+
+    def _points_from_structured(self, points_structured):
+        """ Return a 2D view of structured points when all fields share a type, else the structured array """
+
+        if self.point_type is None:
+            return points_structured
+
+        return points_structured.view(self.point_type).reshape(len(points_structured), -1)
+
+
+    def read_pcd_header(self, f, bPrint = False):
+        """
+        Read and parse PCD file header, leaving the file positioned at the start of the data
+
+        Parameters:
+            f (file) : PCD file opened in binary mode
+            bPrint (bool) : Debug print
+
+        Returns:
+
+        Exceptions:
+            TypeError:  if datatype in PCD file is not recognized
+        """
         # Read and Parse Header
         header_complete = False
+        fields = None
+        sizes = None
+        field_types = None
+        counts = None
+        self.quantization = None
 
         while not header_complete:
 
             line = f.readline()
+            if not line:
+                print("[ERROR] PCD header ended before 'DATA' field")
+                raise TypeError
             line = line.decode("utf-8")    # Header fields are always in ASCII
             line = line.replace('\n', '').replace('\r', '')   # Remove CRLF
 
+            # Scales and offsets of quantized fields, written by write_pcd_file
+            if line.upper().startswith("# QUANTIZATION"):
+                values = line.split()[2:]
+                self.quantization = {values[i]: (float(values[i + 1]), float(values[i + 2]))
+                    for i in range(0, len(values) - 2, 3)}
+                if bPrint:
+                    print(line)
+                continue
+
             # Skip comments
             if line.startswith("#"):
                 if bPrint:
@@ -77,7 +735,7 @@ class PointCloud:
                 continue
 
             if line.upper().startswith("FIELDS"):
-                fields = line.split(' ')
+                fields = line.split()
                 self.num_fields = len(fields) - 1
                 if self.num_fields == 3:
                     self.point_cloud_type = "XYZ"
@@ -89,23 +747,21 @@ class PointCloud:
                 continue
 
             if line.upper().startswith("SIZE"):
-                sizes = line.split(' ')
-                data_size = int(sizes[1])
+                sizes = line.split()
                 if (bPrint):
                     for size in sizes:
                         print(size)
                 continue
 
             if line.upper().startswith("TYPE"):
-                field_types = line.split(' ')
+                field_types = line.split()
                 if (bPrint):
                     for field in field_types:
                         print(field)
-                field_type = field_types[1]
                 continue
                 
             if line.upper().startswith("COUNT"):
-                counts = line.split(' ')
+                counts = line.split()
                 if (bPrint):
                     for count in counts:
                         print(count)
@@ -143,51 +799,25 @@ class PointCloud:
                 header_complete = True #  Exit header and start processing actual points 
                 continue
 
-        if field_type == "F":
-            self.point_type = float_types[data_size]
-
-        elif field_type == "U":
-            self.point_type = unsigned_types[data_size]
-
-        elif field_type == "I":
-            self.point_type = signed_types[data_size]
-
-        else: 
-            print("[ERROR] Invalid 'TYPE' field in the PCD file: " + field_type)
+        if fields is None or sizes is None or field_types is None:
+            print("[ERROR] PCD header is missing 'FIELDS', 'SIZE' or 'TYPE' field")
             raise TypeError
-            
-        self.points_array = []
-
-        # read ASCII data
-        if self.file_type == "ASCII":
-            self.points_array_full = np.loadtxt(f, dtype = self.point_type)
 
-        elif self.file_type == "BINARY":
-            self.points_array_full = np.fromfile(f, dtype = self.point_type)
-            self.points_array_full = np.reshape(self.points_array_full, (self.num_points, self.num_fields))
-
-        else:
-            print("[ERROR] Invalid 'DATA' field in the PCD file: " + self.file_type)
-            raise TypeError
-                    
-        f.close()
+        if counts is None:
+            counts = ["COUNT"] + ["1"] * self.num_fields
 
-        self.points_array = self.points_array_full
-        (rows, cols) = self.points_array.shape
-        if cols == 4:
-            # Remove intensity channel for now
-            self.points_array = np.delete(self.points_array, 3, axis=1)
-        
-        return self.points_array
+        self.point_dtype = create_point_dtype(fields[1:], sizes[1:], field_types[1:], counts[1:])
+        self.fields = list(self.point_dtype.names)
+        self.point_type = get_common_type(self.point_dtype)
 
 
     def write_pcd_file(self, file_name, file_type = "BINARY", bPrint = False):
         """
-        Write point cloud into a PCD file (both Binary and ASCII files are supported)
+        Write point cloud into a PCD file (Binary, Binary compressed and ASCII files are supported)
 
         Parameters:
             file_name (string) : Name and Path to the PCD file to be written
-            file_type (string) : "BINARY" or "ASCII"
+            file_type (string) : "BINARY", "BINARY_COMPRESSED" or "ASCII"
             bPrint (bool) : Debug Print
 
         Returns:
@@ -195,83 +825,153 @@ class PointCloud:
         Exceptions:
             IOError: if input file cannot be read
             ValueError: invalid input parameter 
+            ImportError: if python-lzf is not installed for large BINARY_COMPRESSED data
         """        
-        if file_type == "ASCII":
-            flags = "w"
-        elif file_type == "BINARY":
-            flags = "wb"
-        else:
-            raise ValueError("file_type must be 'ASCII' or 'BINARY'")
-        
+        if file_type not in ("ASCII", "BINARY", "BINARY_COMPRESSED"):
+            raise ValueError("file_type must be 'ASCII', 'BINARY' or 'BINARY_COMPRESSED'")
+
+        metrics = start_metrics("write_pcd_file", file_name) if active_collectors else None
+
         try:
-            f = open(file_name, flags)
+            points = self.get_structured_points()
 
-        except:
-            print("[ERROR]: Could not open file '" + file_name + "'")
-            raise IOError
+            try:
+                f = open(file_name, "wb")
 
+            except:
+                print("[ERROR]: Could not open file '" + file_name + "'")
+                raise IOError
 
-        if file_type == "ASCII":
-            f.write("# .PCD v.7 - Point Cloud Data file format\n")
-            f.write("VERSION .7\n")
-        
-            if self.point_cloud_type == "XYZ":
-                f.write("FIELDS x y z\n")
-                f.write("SIZE 4 4 4\n")
-                f.write("TYPE F F F\n")
-                f.write("COUNT 1 1 1\n")
-            elif self.point_cloud_type == "XYZI":
-                f.write("FIELDS x y z intensity\n")
-                f.write("SIZE 4 4 4 4\n")
-                f.write("TYPE F F F F\n")
-                f.write("COUNT 1 1 1 1\n")
-
-            f.write("WIDTH " + str(self.width) + "\n" )
-            f.write("HEIGHT " + str(self.height) + "\n")
-            f.write("VIEWPOINT " + self.viewpoint + "\n")
-            f.write("POINTS " + str(self.num_points) + "\n" )
-
-            f.write("DATA ascii\n")
-            for x in self.points_array_full:
-                if self.point_cloud_type == "XYZ":
-                    f.write(f"{x[0]:.8f} {x[1]:.8f} {x[2]:.8f}\n")
-                elif self.point_cloud_type == "XYZI":
-                    f.write(f"{x[0]:.8f} {x[1]:.8f} {x[2]:.8f} {x[3]:.8f}\n")
-
-        elif file_type == "BINARY":
-
-            f.write(b"# .PCD v.7 - Point Cloud Data file format\n")
-            f.write(b"VERSION .7\n")
-        
-            if self.point_cloud_type == "XYZ":
-                f.write(b"FIELDS x y z\n")
-                f.write(b"SIZE 4 4 4\n")
-                f.write(b"TYPE F F F\n")
-                f.write(b"COUNT 1 1 1\n")
-            elif self.point_cloud_type == "XYZI":
-                f.write(b"FIELDS x y z intensity\n")
-                f.write(b"SIZE 4 4 4 4\n")
-                f.write(b"TYPE F F F F\n")
-                f.write(b"COUNT 1 1 1 1\n")
-
-            output_line = "WIDTH " + str(self.width) + "\n"
-            f.write(output_line.encode())
-            output_line = "HEIGHT " + str(self.height) + "\n"
-            f.write(output_line.encode())
-            output_line = "VIEWPOINT " + self.viewpoint + "\n"
-            f.write(output_line.encode())
-            output_line = "POINTS " + str(self.num_points) + "\n"
-            f.write(output_line.encode())
-
-            f.write(b"DATA binary\n")
-            for x in self.points_array_full:
-                f.write(x[0])
-                f.write(x[1])
-                f.write(x[2])
-                if self.point_cloud_type == "XYZI":
-                    f.write(x[3])
+            header = self.get_pcd_header(points.dtype, file_type.lower())
+            if bPrint:
+                print(header)
+            f.write(header.encode())
+            if metrics is not None:
+                metrics.end_header()
 
-        f.close()
+            if file_type == "ASCII":
+                # One column per value, a chunk of rows formatted with a single '%' operation
+                value_formats = []
+                for name in points.dtype.names:
+                    field_dtype = points.dtype.fields[name][0]
+                    count = max(1, field_dtype.itemsize // field_dtype.base.itemsize)
+                    if field_dtype.base.kind == "f":
+                        value_formats += ["%.8f"] * count
+                    else:
+                        value_formats += ["%d"] * count
+                row_format = " ".join(value_formats) + "\n"
+
+                for start in range(0, len(points), ASCII_CHUNK_POINTS):
+                    chunk = points[start:start + ASCII_CHUNK_POINTS]
+                    columns = []
+                    for name in points.dtype.names:
+                        field = np.reshape(chunk[name], (len(chunk), -1))
+                        columns += [field[:, i].tolist() for i in range(field.shape[1])]
+                    values = tuple(itertools.chain.from_iterable(zip(*columns)))
+                    f.write(((row_format * len(chunk)) % values).encode())
+
+            elif file_type == "BINARY":
+                # Single bulk write of the contiguous array
+                f.write(points.view(np.uint8).data)
+
+            elif file_type == "BINARY_COMPRESSED":
+                # Store data field by field, then compress
+                data = b"".join([np.ascontiguousarray(points[name]).tobytes() for name in points.dtype.names])
+                compressed = lzf_compress(data)
+                f.write(np.array([len(compressed), len(data)], dtype = np.uint32).tobytes())
+                f.write(compressed)
+
+            if metrics is not None:
+                metrics.file_type = file_type
+                metrics.bytes_written = f.tell()
+                if not np.may_share_memory(points, self.points_array_full):
+                    metrics.copies += 1
+                if file_type == "BINARY_COMPRESSED":
+                    metrics.copies += 1
+
+            f.close()
+
+            if metrics is not None:
+                metrics.end_payload()
+
+        except Exception as error:
+            if metrics is not None:
+                metrics.error = repr(error)
+            raise
+
+        finally:
+            if metrics is not None:
+                metrics.finish()
+
+
+    def get_structured_points(self):
+        """
+        Get point cloud data as a contiguous structured array with one named field per PCD field
+
+        Returns:
+            Numpy structured array of the point cloud data
+
+        Exceptions:
+            ValueError: if point data type is not supported by PCD files
+        """
+        points = np.ascontiguousarray(self.points_array_full)
+
+        if points.dtype.names is None:
+            # Plain 2D array, one field per column
+            points = np.reshape(points, (len(points), -1))
+            num_columns = points.shape[1]
+            if (self.point_dtype is not None and get_common_type(self.point_dtype) == points.dtype.type
+                    and self.point_dtype.itemsize == num_columns * points.itemsize):
+                dtype = self.point_dtype
+            else:
+                if num_columns == 4:
+                    fields = ["x", "y", "z", "intensity"]
+                else:
+                    fields = ["x", "y", "z"] + ["field_" + str(i) for i in range(3, num_columns)]
+                dtype = np.dtype([(name, points.dtype) for name in fields[:num_columns]])
+            points = points.view(dtype).reshape(len(points))
+
+        for name in points.dtype.names:
+            field_dtype = points.dtype.fields[name][0].base
+            if field_dtype.kind not in pcd_type_codes or field_dtype.itemsize not in (1, 2, 4, 8):
+                raise ValueError("Unsupported point data type: " + str(field_dtype))
+
+        return points
+
+
+    def get_pcd_header(self, dtype, data_type = "binary"):
+        """
+        Create PCD header text for the current point cloud
+
+        Parameters:
+            dtype (numpy dtype) : Structured data type of a point
+            data_type (string) : Value of the 'DATA' field
+
+        Returns:
+            header (string) : PCD header including the 'DATA' line
+        """
+        dtype = np.dtype(dtype)
+        (sizes, types, counts) = get_pcd_field_info(dtype)
+        sizes = [str(size) for size in sizes]
+        counts = [str(count) for count in counts]
+
+        header = "# .PCD v.7 - Point Cloud Data file format\n"
+        if self.quantization:
+            # Other readers skip the comment and see the integer values
+            header += "# QUANTIZATION " + " ".join(name + " " + repr(float(scale)) + " " + repr(float(offset))
+                for (name, (scale, offset)) in self.quantization.items() if name in dtype.names) + "\n"
+        header += "VERSION .7\n"
+        header += "FIELDS " + " ".join(dtype.names) + "\n"
+        header += "SIZE " + " ".join(sizes) + "\n"
+        header += "TYPE " + " ".join(types) + "\n"
+        header += "COUNT " + " ".join(counts) + "\n"
+        header += "WIDTH " + str(self.width) + "\n"
+        header += "HEIGHT " + str(self.height) + "\n"
+        header += "VIEWPOINT " + self.viewpoint + "\n"
+        header += "POINTS " + str(self.num_points) + "\n"
+        header += "DATA " + data_type + "\n"
+
+        return header
 
     def read_kitti_file(self, file_name, bPrint = False):
         """
@@ -288,36 +988,182 @@ class PointCloud:
             IOError: if input file cannot be read
             ValueError: invalid input parameter 
         """       
+        metrics = start_metrics("read_kitti_file", file_name) if active_collectors else None
+
         try:
-            f = open(file_name, "rb")
+            try:
+                f = open(file_name, "rb")
 
-        except:
-            print("[ERROR]: Could not open file '" + file_name + "'")
-            raise IOError
+            except:
+                print("[ERROR]: Could not open file '" + file_name + "'")
+                raise IOError
+
+            if metrics is not None:
+                # KITTI files have no header
+                metrics.end_header()
+
+            # KITTI velodyne data is a flat array of float32 (x, y, z, reflectance)
+            self.points_array_full = np.fromfile(f, dtype=np.float32).reshape(-1, 4)
+            self.spatial_index = None
+            self.quantization = None
+            if metrics is not None:
+                metrics.file_type = "KITTI"
+                metrics.bytes_read = f.tell()
+                metrics.points_decoded = len(self.points_array_full)
+            f.close()
+            self.points_array = self.points_array_full[:, :3]
+            self.intensity_array = self.points_array_full[:, 3]
+            self.fields = ["x", "y", "z", "intensity"]
+            self.point_dtype = np.dtype([(name, np.float32) for name in self.fields])
+            self.points_structured = self.points_array_full.view(self.point_dtype).reshape(-1)
+
+            self.file_type = "BINARY"
+            self.point_cloud_type ="XYZI"
+            self.point_type = np.float32
+            self.width = len(self.points_array)
+            self.height = 1
+            self.viewpoint = "0 0 0 1 0 0 0"
+            self.num_points = len(self.points_array)
+            self.num_fields = 4
+
+            if metrics is not None:
+                metrics.end_payload()
+
+            return self.points_array
+
+        except Exception as error:
+            if metrics is not None:
+                metrics.error = repr(error)
+            raise
+
+        finally:
+            if metrics is not None:
+                metrics.finish()
+
+
+def read_kitti_sequence(directory, max_workers = None, bPrint = False):
+    """
+    Read all KITTI pointcloud files ('*.bin') of a sequence directory in parallel
+
+    Parameters:
+        directory (string) : Path to the KITTI 'velodyne' directory
+        max_workers (int) : Number of reader threads, None for the default
+        bPrint (bool) : Debug Print
+
+    Returns:
+        point_clouds : List of PointCloud objects in file name order
+
+    Exceptions:
+        IOError: if a file cannot be read
+    """
+    file_names = sorted(glob.glob(os.path.join(directory, "*.bin")))
+    if bPrint:
+        print("Reading " + str(len(file_names)) + " KITTI files from '" + directory + "'")
 
+    def read_frame(file_name):
+        point_cloud = PointCloud()
+        point_cloud.read_kitti_file(file_name)
+        return point_cloud
 
-        points_list = []
-        content=f.read()
+    # File reads release the GIL, so threads overlap the I/O
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        point_clouds = list(executor.map(read_frame, file_names))
 
-        points_iter = struct.iter_unpack('ffff', content)
+    return point_clouds
 
-        for idx,point in enumerate(points_iter):
-            points_list.append([point[0],point[1],point[2],point[3]])
 
-        self.points_array_full = np.asarray(points_list, dtype=np.float32)    
-        self.points_array = np.delete(self.points_array_full, 3, axis=1)
+def probe_point_cloud_file(file_name, bounds = False, chunk_points = 1000000):
+    """
+    Read PCD or KITTI file metadata without reading the point data
 
-        self.file_type = "BINARY"
-        self.point_cloud_type ="XYZI"
-        self.point_type = np.float32
-        self.width = len(self.points_array)
-        self.height = 1
-        self.viewpoint = "0 0 0 1 0 0 0"
-        self.num_points = len(self.points_array)
-        self.num_fields = 4
+    PCD files are read until the 'DATA' line. KITTI ('.bin') metadata is
+    derived from the file size.
+
+    Parameters:
+        file_name (string) : Name and Path to the PCD or KITTI file
+        bounds (bool) : Also compute x, y, z bounding box. This streams
+            through the point data in blocks of chunk_points points
+        chunk_points (int) : Number of points in each block when computing bounds
+
+    Returns:
+        info (dict) : 'file_type', 'fields', 'sizes', 'types', 'counts',
+            'num_points', 'width', 'height', 'viewpoint', 'data_offset',
+            'bounds' ([min_x, min_y, min_z, max_x, max_y, max_z] or None) and
+            'quantization' ({name: (scale, offset)} or None)
+
+    Exceptions:
+        IOError: if input file cannot be read
+        TypeError:  if datatype in PCD file is not recognized
+    """
+    point_cloud = PointCloud()
+
+    if file_name.lower().endswith(".bin"):
+        # KITTI velodyne file, float32 (x, y, z, reflectance) per point
+        file_size = os.path.getsize(file_name)
+        num_points = file_size // 16
+        info = { "file_type": "KITTI", "fields": ["x", "y", "z", "intensity"],
+            "sizes": [4, 4, 4, 4], "types": ["F", "F", "F", "F"], "counts": [1, 1, 1, 1],
+            "num_points": num_points, "width": num_points, "height": 1,
+            "viewpoint": "0 0 0 1 0 0 0", "data_offset": 0, "bounds": None,
+            "quantization": None }
+
+        if bounds and num_points > 0:
+            points = np.memmap(file_name, dtype = np.float32, mode = "r", shape = (num_points, 4))
+            info["bounds"] = get_bounds(points[start:start + chunk_points, :3]
+                for start in range(0, num_points, chunk_points))
+
+        return info
+
+    try:
+        f = open(file_name, "rb")
+
+    except:
+        print("[ERROR]: Could not open file '" + file_name + "'")
+        raise IOError
+
+    try:
+        point_cloud.read_pcd_header(f)
+        data_offset = f.tell()
+    finally:
+        f.close()
+
+    (sizes, types, counts) = get_pcd_field_info(point_cloud.point_dtype)
+    info = { "file_type": point_cloud.file_type, "fields": point_cloud.fields,
+        "sizes": sizes, "types": types, "counts": counts,
+        "num_points": point_cloud.num_points, "width": point_cloud.width,
+        "height": point_cloud.height, "viewpoint": point_cloud.viewpoint,
+        "data_offset": data_offset, "bounds": None, "quantization": point_cloud.quantization }
+
+    if bounds and point_cloud.num_points > 0 and all(name in point_cloud.fields for name in ("x", "y", "z")):
+        chunks = point_cloud.iter_pcd_chunks(file_name, chunk_points, structured = True)
+        info["bounds"] = get_bounds(rfn.structured_to_unstructured(chunk[["x", "y", "z"]])
+            for (offset, chunk) in chunks)
+        if info["bounds"] is not None and point_cloud.quantization:
+            # Bounds of the dequantized coordinates, scales are positive
+            for (axis, name) in enumerate(("x", "y", "z")):
+                (scale, offset) = point_cloud.quantization.get(name, (1.0, 0.0))
+                info["bounds"][axis] = info["bounds"][axis] * scale + offset
+                info["bounds"][axis + 3] = info["bounds"][axis + 3] * scale + offset
+
+    return info
+
+
+def get_bounds(chunks):
+    """ Return [min_x, min_y, min_z, max_x, max_y, max_z] over blocks of (N, 3) points """
+
+    lower = None
+    upper = None
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        chunk_lower = np.min(chunk, axis = 0)
+        chunk_upper = np.max(chunk, axis = 0)
+        if lower is None:
+            (lower, upper) = (chunk_lower, chunk_upper)
+        else:
+            (lower, upper) = (np.minimum(lower, chunk_lower), np.maximum(upper, chunk_upper))
 
-        return self.points_array
-        
-        
+    if lower is None:
+        return None
 
-        
+    return [float(value) for value in lower] + [float(value) for value in upper]
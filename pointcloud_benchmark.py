@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Benchmark
+
+    Benchmark of PCD and KITTI file reading and writing and of the shape
+    generators on synthetic point clouds created locally, so no downloads
+    are needed. Every case reports time, points/s, MB/s and peak memory.
+    Results are saved as JSON and can be compared against an earlier run
+    to find regressions.
+
+    Files are read right after they are written, so read times are
+    measured from the operating system file cache.
+
+    Usage:
+        python pointcloud_benchmark.py [--max-points 100000000] [--output results.json]
+            [--compare baseline.json]
+
+    Author: Jari Honkanen
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from pointcloud import PointCloud, create_point_dtype
+from pointcloud_shapes import create_box_points, create_ellipse_points, create_torus_points
+
+# Modes of the file cases, (name, write file_type, read keyword arguments)
+pcd_modes = [
+    ("ascii", "ASCII", {}),
+    ("binary", "BINARY", {}),
+    ("binary_mmap", "BINARY", {"memory_map": True}),
+    ("binary_compressed", "BINARY_COMPRESSED", {}),
+]
+
+# Shape generators and the step giving about num_points points
+shape_generators = [
+    ("ellipse", lambda num_points: create_ellipse_points(step = np.sqrt(4 * np.pi / num_points))),
+    ("torus", lambda num_points: create_torus_points(step = 2 * np.pi / np.sqrt(num_points))),
+    ("box", lambda num_points: create_box_points(step = np.sqrt(6.0 / num_points))),
+]
+
+# ASCII files of larger clouds take too long to be useful
+MAX_ASCII_POINTS = 10000000
+
+
+def create_synthetic_point_cloud(num_points, seed = 0):
+    """
+    Create PointCloud of uniformly random x, y, z, intensity float32 points
+
+    Parameters:
+        num_points (int) : Number of points
+        seed (int) : Random seed
+
+    Returns:
+        PointCloud
+    """
+    rng = np.random.default_rng(seed)
+    fields = ["x", "y", "z", "intensity"]
+    points_structured = np.empty(num_points, dtype = create_point_dtype(fields, [4] * 4, ["F"] * 4, [1] * 4))
+    for name in fields[:3]:
+        points_structured[name] = rng.uniform(-50.0, 50.0, num_points)
+    points_structured["intensity"] = rng.random(num_points, dtype = np.float32)
+
+    point_cloud = PointCloud()
+    point_cloud.set_structured_points(points_structured)
+    point_cloud.width = num_points
+    point_cloud.height = 1
+    point_cloud.viewpoint = "0 0 0 1 0 0 0"
+
+    return point_cloud
+
+
+def measure(function, repeat = 3):
+    """
+    Measure a function call
+
+    The best time of repeat calls is reported. Peak memory is measured
+    with tracemalloc in a separate call, so that tracing does not affect
+    the timing.
+
+    Parameters:
+        function : Function without arguments, returns the number of points it handled
+        repeat (int) : Number of timed calls
+
+    Returns:
+        (seconds, peak_bytes, num_points)
+    """
+    seconds = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        num_points = function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    (current, peak_bytes) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (seconds, peak_bytes, num_points)
+
+
+def get_result(name, seconds, peak_bytes, num_points, num_bytes):
+    """ Create result entry of one benchmark case """
+
+    seconds = max(seconds, 1e-9)
+    return {
+        "name": name,
+        "points": int(num_points),
+        "bytes": int(num_bytes),
+        "seconds": seconds,
+        "points_per_second": num_points / seconds,
+        "mb_per_second": num_bytes / seconds / 1e6,
+        "peak_memory_mb": peak_bytes / 1e6,
+    }
+
+
+def run_benchmarks(sizes, work_dir, repeat = 3, bPrint = True):
+    """
+    Run all benchmark cases for each cloud size
+
+    Parameters:
+        sizes (list) : Numbers of points of the synthetic clouds
+        work_dir (string) : Directory for the benchmark files
+        repeat (int) : Number of timed calls of each case
+        bPrint (bool) : Print results as they are measured
+
+    Returns:
+        list of result entries
+    """
+    results = []
+
+    def add_result(name, timing, num_bytes):
+        result = get_result(name, *timing, num_bytes)
+        results.append(result)
+        if bPrint:
+            print(f"{name:28s} {result['points']:>11d} pts {result['seconds']:10.4f} s "
+                f"{result['points_per_second'] / 1e6:10.2f} Mpts/s {result['mb_per_second']:10.1f} MB/s "
+                f"{result['peak_memory_mb']:10.1f} MB peak")
+
+    for num_points in sizes:
+        point_cloud = create_synthetic_point_cloud(num_points)
+
+        for (name, generator) in shape_generators:
+            timing = measure(lambda: len(generator(num_points)), repeat)
+            add_result("create_" + name, timing, timing[2] * 3 * 8)
+
+        for (name, file_type, read_kwargs) in pcd_modes:
+            if file_type == "ASCII" and num_points > MAX_ASCII_POINTS:
+                continue
+            file_name = os.path.join(work_dir, f"benchmark_{num_points}_{file_type.lower()}.pcd")
+
+            if not read_kwargs:
+                def write_file():
+                    point_cloud.write_pcd_file(file_name, file_type)
+                    return num_points
+                add_result("write_pcd_" + name, measure(write_file, repeat), os.path.getsize(file_name))
+
+            def read_file():
+                read_cloud = PointCloud()
+                read_cloud.read_pcd_file(file_name, **read_kwargs)
+                # Touch all points, memory mapped data is read on access
+                np.sum(read_cloud.points_array)
+                return read_cloud.num_points
+            add_result("read_pcd_" + name, measure(read_file, repeat), os.path.getsize(file_name))
+
+        file_name = os.path.join(work_dir, f"benchmark_{num_points}.bin")
+        point_cloud.points_array_full.tofile(file_name)
+
+        def read_kitti():
+            read_cloud = PointCloud()
+            read_cloud.read_kitti_file(file_name)
+            return read_cloud.num_points
+        add_result("read_kitti", measure(read_kitti, repeat), os.path.getsize(file_name))
+
+        for file_name in os.listdir(work_dir):
+            if file_name.startswith(f"benchmark_{num_points}"):
+                os.remove(os.path.join(work_dir, file_name))
+
+    return results
+
+
+def compare_results(results, baseline, threshold = 0.1):
+    """
+    Print throughput of results relative to a baseline run
+
+    Parameters:
+        results (list) : Result entries of this run
+        baseline (list) : Result entries of the baseline run
+        threshold (float) : Relative slowdown reported as a regression
+
+    Returns:
+        Number of regressions
+    """
+    baseline_results = {(result["name"], result["points"]): result for result in baseline}
+    regressions = 0
+    for result in results:
+        reference = baseline_results.get((result["name"], result["points"]))
+        if reference is None:
+            continue
+        ratio = result["points_per_second"] / max(reference["points_per_second"], 1e-9)
+        status = ""
+        if ratio < 1.0 - threshold:
+            status = "REGRESSION"
+            regressions += 1
+        print(f"{result['name']:28s} {result['points']:>11d} pts {ratio:8.2f}x {status}")
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Benchmark point cloud I/O and shape generators")
+    parser.add_argument("--min-points", type = float, default = 1e4, help = "Smallest cloud, default 1e4")
+    parser.add_argument("--max-points", type = float, default = 1e6, help = "Largest cloud, up to 1e8, default 1e6")
+    parser.add_argument("--repeat", type = int, default = 3, help = "Timed calls of each case")
+    parser.add_argument("--work-dir", default = None, help = "Directory for the benchmark files")
+    parser.add_argument("--output", default = "benchmark_results.json", help = "JSON results file")
+    parser.add_argument("--compare", default = None, help = "JSON results file of a baseline run")
+    args = parser.parse_args()
+
+    # Powers of ten from min to max points
+    sizes = [10 ** exponent for exponent in range(int(round(np.log10(args.min_points))),
+        int(round(np.log10(args.max_points))) + 1)]
+
+    with tempfile.TemporaryDirectory(dir = args.work_dir) as work_dir:
+        results = run_benchmarks(sizes, work_dir, args.repeat)
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(run, f, indent = 2)
+    print(f"Results written to '{args.output}'")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Throughput relative to '{args.compare}':")
+        compare_results(results, baseline["results"])
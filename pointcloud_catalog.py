@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Catalog
+
+    Persistent metadata catalog of PCD and KITTI files stored in a SQLite
+    database. Files are indexed with header-only probes and re-indexing
+    skips files whose path, modification time and size are unchanged.
+
+    Author: Jari Honkanen
+
+"""
+
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pointcloud import probe_point_cloud_file
+
+# File extensions included in the catalog
+catalog_extensions = (".pcd", ".bin")
+
+
+class PointCloudCatalog:
+    """ Cached metadata catalog of point cloud files """
+
+    def __init__(self, catalog_file):
+        """
+        Open or create catalog
+
+        Parameters:
+            catalog_file (string) : Name and Path to the catalog database file
+        """
+        self.catalog_file = catalog_file
+        self.connection = sqlite3.connect(catalog_file)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            has_bounds INTEGER NOT NULL,
+            info TEXT NOT NULL)""")
+        self.connection.commit()
+
+
+    def close(self):
+        """ Close catalog database """
+        self.connection.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+    def index(self, directory, bounds = False, max_workers = None, bPrint = False):
+        """
+        Index all PCD and KITTI files under a directory
+
+        Parameters:
+            directory (string) : Root directory to be indexed recursively
+            bounds (bool) : Also compute bounding boxes of new or changed files
+            max_workers (int) : Number of probe threads, None for the default
+            bPrint (bool) : Debug Print
+
+        Returns:
+            (num_indexed, num_skipped, num_removed) : Number of probed files,
+                unchanged files and catalog entries of deleted files
+        """
+        cached = {}
+        for (path, mtime_ns, size, has_bounds) in self.connection.execute(
+                "SELECT path, mtime_ns, size, has_bounds FROM files"):
+            cached[path] = (mtime_ns, size, has_bounds)
+
+        # Find files that are new or changed since the last index
+        seen = set()
+        changed = []
+        for (root, dirs, files) in os.walk(directory):
+            for file_name in files:
+                if not file_name.lower().endswith(catalog_extensions):
+                    continue
+                path = os.path.abspath(os.path.join(root, file_name))
+                stat = os.stat(path)
+                seen.add(path)
+                entry = cached.get(path)
+                if (entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size
+                        and (entry[2] or not bounds)):
+                    continue
+                changed.append((path, stat.st_mtime_ns, stat.st_size))
+
+        def probe(file_entry):
+            (path, mtime_ns, size) = file_entry
+            try:
+                info = probe_point_cloud_file(path, bounds = bounds)
+            except (IOError, TypeError, ValueError, UnicodeDecodeError, IndexError, ImportError):
+                if bPrint:
+                    print("[WARNING]: Could not probe file '" + path + "'")
+                return None
+            return (path, mtime_ns, size, int(bounds), json.dumps(info))
+
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            rows = [row for row in executor.map(probe, changed) if row is not None]
+
+        self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows)
+
+        # Drop entries of files that no longer exist under the directory
+        root = os.path.join(os.path.abspath(directory), "")
+        removed = [(path,) for path in cached if path.startswith(root) and path not in seen]
+        self.connection.executemany("DELETE FROM files WHERE path = ?", removed)
+        self.connection.commit()
+
+        if bPrint:
+            print("Indexed " + str(len(rows)) + " files, skipped " + str(len(seen) - len(changed))
+                + " unchanged files, removed " + str(len(removed)) + " entries")
+
+        return (len(rows), len(seen) - len(changed), len(removed))
+
+
+    def get(self, path):
+        """
+        Get metadata of a single file
+
+        Parameters:
+            path (string) : Name and Path to the point cloud file
+
+        Returns:
+            info (dict) : Metadata as returned by probe_point_cloud_file, None if not in catalog
+        """
+        row = self.connection.execute("SELECT info FROM files WHERE path = ?",
+            (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return None
+
+        return json.loads(row[0])
+
+
+    def entries(self):
+        """
+        Iterate over all catalog entries
+
+        Returns:
+            (path, info) : Generator of file path and metadata dictionary
+        """
+        for (path, info) in self.connection.execute("SELECT path, info FROM files ORDER BY path"):
+            yield (path, json.loads(info))
+
+
+    def total_points(self):
+        """ Return total number of points of all files in the catalog """
+
+        num_points = 0
+        for (path, info) in self.entries():
+            num_points += info["num_points"]
+
+        return num_points
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3:
+        print("Usage: python pointcloud_catalog.py <catalog file> <directory> [--bounds]")
+        sys.exit(1)
+
+    with PointCloudCatalog(sys.argv[1]) as catalog:
+        catalog.index(sys.argv[2], bounds = "--bounds" in sys.argv[3:], bPrint = True)
+        print(f"Catalog contains {catalog.total_points()} points")
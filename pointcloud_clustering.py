@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Clustering
+
+    Euclidean cluster extraction over a voxel hash. Points are hashed into
+    voxels with the cluster tolerance as edge length, and occupied voxels
+    that touch, including across edges and corners, are joined with a
+    vectorized union-find. Points closer than the tolerance always end up
+    in the same cluster. Clusters separated by less than about twice the
+    voxel diagonal may be merged.
+
+    Author: Jari Honkanen
+
+"""
+
+import numpy as np
+from pointcloud_filters import KEY_BITS, KEY_MASK, get_points, get_voxel_keys, group_voxels
+
+# The 13 neighbor voxels in the positive half of the 26-neighborhood, the
+# other half is covered by the edges of the neighbors
+neighbor_offsets = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+    if (dx, dy, dz) > (0, 0, 0)]
+
+# Neighbors are looked up in a dense voxel grid when it has at most this
+# many cells per occupied voxel, otherwise with binary searches
+DENSE_GRID_RATIO = 64
+
+
+def connected_components(num_nodes, edges_a, edges_b):
+    """
+    Label connected components of a graph with a vectorized union-find
+
+    Every round hooks the larger root of each edge under the smaller root
+    and then compresses the paths, until no edge joins two trees.
+
+    Parameters:
+        num_nodes (int) : Number of nodes
+        edges_a, edges_b : Numpy Arrays (E,) of edge end nodes
+
+    Returns:
+        Numpy Array (num_nodes,) of the smallest node index of each component
+    """
+    parent = np.arange(num_nodes, dtype = edges_a.dtype)
+    while True:
+        roots_a = parent[edges_a]
+        roots_b = parent[edges_b]
+        joined = roots_a != roots_b
+        if not np.any(joined):
+            break
+        # Only edges between different trees are needed in later rounds
+        (edges_a, edges_b) = (edges_a[joined], edges_b[joined])
+        (roots_a, roots_b) = (roots_a[joined], roots_b[joined])
+        np.minimum.at(parent, np.maximum(roots_a, roots_b), np.minimum(roots_a, roots_b))
+
+        # Path compression until every node points to its root
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+    return parent
+
+
+def get_voxel_edges(voxel_keys):
+    """
+    Find pairs of occupied voxels that touch
+
+    Parameters:
+        voxel_keys : Numpy Array (V,) of sorted unique packed voxel keys
+
+    Returns:
+        (edges_a, edges_b) : Numpy Arrays (E,) of voxel indices
+    """
+    num_voxels = len(voxel_keys)
+    coords = np.stack(((voxel_keys >> (2 * KEY_BITS)) & KEY_MASK, (voxel_keys >> KEY_BITS) & KEY_MASK,
+        voxel_keys & KEY_MASK), axis = 1)
+    lower = np.min(coords, axis = 0)
+    # One empty cell of padding on every side, so that neighbors never leave the grid
+    shape = np.max(coords, axis = 0) - lower + 3
+    num_cells = int(np.prod(shape))
+
+    edges_a = []
+    edges_b = []
+    if num_cells <= DENSE_GRID_RATIO * num_voxels:
+        cells = np.ravel_multi_index((coords - lower + 1).T, shape)
+        # 32-bit voxel indices halve the memory traffic of the lookups and the union-find
+        grid = np.full(num_cells, -1, dtype = np.int32)
+        grid[cells] = np.arange(num_voxels, dtype = np.int32)
+        for (dx, dy, dz) in neighbor_offsets:
+            found = grid[cells + int((dx * shape[1] + dy) * shape[2] + dz)]
+            occupied = found >= 0
+            edges_a.append(np.flatnonzero(occupied).astype(np.int32))
+            edges_b.append(found[occupied])
+    else:
+        for (dx, dy, dz) in neighbor_offsets:
+            # Keys of voxels at the origin corner are at least 2^20, neighbor keys never borrow between axes
+            neighbor_keys = voxel_keys + ((dx << (2 * KEY_BITS)) + (dy << KEY_BITS) + dz)
+            found = np.minimum(np.searchsorted(voxel_keys, neighbor_keys), num_voxels - 1)
+            occupied = voxel_keys[found] == neighbor_keys
+            edges_a.append(np.flatnonzero(occupied).astype(np.int32))
+            edges_b.append(found[occupied].astype(np.int32))
+
+    return (np.concatenate(edges_a), np.concatenate(edges_b))
+
+
+def euclidean_clustering(point_cloud, tolerance = 0.5, min_cluster_size = 1, max_cluster_size = None):
+    """
+    Split point cloud into clusters of connected points
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        tolerance (float) : Cluster tolerance, used as the voxel edge length
+        min_cluster_size (int) : Smaller clusters are labeled -1
+        max_cluster_size (int) : Larger clusters are labeled -1, None for no limit
+
+    Returns:
+        (labels, boxes, counts) : Numpy Array (N,) of cluster labels, -1 for
+            points of rejected clusters, Numpy Array (C, 6) of cluster
+            bounding boxes [min_x, min_y, min_z, max_x, max_y, max_z] and
+            Numpy Array (C,) of point counts. Clusters are ordered by size,
+            largest first
+    """
+    points = get_points(point_cloud)[:, :3]
+    num_points = len(points)
+    if num_points == 0:
+        return (np.zeros(0, dtype = np.int64), np.zeros((0, 6), dtype = points.dtype), np.zeros(0, dtype = np.int64))
+
+    keys = get_voxel_keys(points, tolerance, np.min(points, axis = 0))
+    (order, starts, voxel_counts) = group_voxels(keys)
+    voxel_keys = keys[order[starts]]
+    num_voxels = len(voxel_keys)
+
+    # Voxel of every point
+    point_voxels = np.empty(num_points, dtype = np.int64)
+    point_voxels[order] = np.repeat(np.arange(num_voxels), voxel_counts)
+
+    (edges_a, edges_b) = get_voxel_edges(voxel_keys)
+    components = connected_components(num_voxels, edges_a, edges_b)
+
+    # Cluster labels by size, largest first
+    (roots, voxel_labels) = np.unique(components, return_inverse = True)
+    cluster_sizes = np.bincount(voxel_labels, weights = voxel_counts, minlength = len(roots)).astype(np.int64)
+    keep = cluster_sizes >= min_cluster_size
+    if max_cluster_size is not None:
+        keep &= cluster_sizes <= max_cluster_size
+    by_size = np.argsort(-cluster_sizes, kind = "stable")
+    by_size = by_size[keep[by_size]]
+    relabel = np.full(len(roots), -1, dtype = np.int64)
+    relabel[by_size] = np.arange(len(by_size))
+
+    voxel_labels = relabel[voxel_labels]
+    labels = voxel_labels[point_voxels]
+    counts = cluster_sizes[by_size]
+    if len(counts) == 0:
+        return (labels, np.zeros((0, 6), dtype = points.dtype), counts)
+
+    # Bounding boxes of the voxels, then of the clusters from the voxels sorted by label
+    sorted_points = points[order]
+    voxel_lower = np.minimum.reduceat(sorted_points, starts, axis = 0)
+    voxel_upper = np.maximum.reduceat(sorted_points, starts, axis = 0)
+    voxel_order = np.argsort(voxel_labels, kind = "stable")
+    voxel_order = voxel_order[voxel_labels[voxel_order] >= 0]
+    box_starts = np.flatnonzero(np.r_[True, np.diff(voxel_labels[voxel_order]) != 0])
+    boxes = np.hstack((np.minimum.reduceat(voxel_lower[voxel_order], box_starts, axis = 0),
+        np.maximum.reduceat(voxel_upper[voxel_order], box_starts, axis = 0)))
+
+    return (labels, boxes, counts)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Batch Converter
+
+    Convert directories of KITTI ('.bin') and PCD files to PCD (ASCII,
+    BINARY or BINARY_COMPRESSED) or KITTI files in a process pool. The
+    directory structure of the input is mirrored in the output. Every
+    output is written to a temporary file and renamed into place, so an
+    interrupted run never leaves partial files. Outputs newer than their
+    input, and written with the requested format and quantization, are
+    skipped.
+
+    Usage:
+        python pointcloud_convert.py <input directory> <output directory>
+            [--format BINARY] [--workers 8] [--precision 0.001] [--force]
+
+    Author: Jari Honkanen
+
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from pointcloud import PointCloud, probe_point_cloud_file
+
+# Input file extensions
+input_extensions = (".pcd", ".bin")
+
+# Output formats, PCD 'DATA' types and KITTI
+output_formats = ("ASCII", "BINARY", "BINARY_COMPRESSED", "KITTI")
+
+
+def get_output_file(input_file, input_dir, output_dir, output_format = "BINARY"):
+    """ Return output path of an input file, mirroring the input directory structure """
+
+    relative = os.path.relpath(input_file, input_dir)
+    extension = ".bin" if output_format == "KITTI" else ".pcd"
+
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + extension)
+
+
+def is_up_to_date(input_file, output_file, output_format = "BINARY", precision = None):
+    """
+    Check whether an output file is newer than its input and was written with the same settings
+
+    The 'DATA' type and the '# QUANTIZATION' comment are read from the
+    output header. Without a precision the output must keep the
+    quantization of the input.
+
+    Parameters:
+        input_file (string) : Name and Path to the KITTI or PCD input file
+        output_file (string) : Name and Path to the output file
+        output_format, precision : Conversion settings, see convert_file
+
+    Returns:
+        True if the output does not need to be converted again
+    """
+    if not os.path.exists(output_file) or os.stat(output_file).st_mtime_ns < os.stat(input_file).st_mtime_ns:
+        return False
+    if output_format == "KITTI":
+        # KITTI files have a single format and are never quantized
+        return True
+
+    try:
+        output_info = probe_point_cloud_file(output_file)
+        if output_info["file_type"] != output_format:
+            return False
+        quantization = output_info["quantization"] or {}
+        if precision is None:
+            return quantization == (probe_point_cloud_file(input_file)["quantization"] or {})
+        return all(name in quantization and quantization[name][0] == float(precision) for name in ("x", "y", "z"))
+
+    except (IOError, TypeError, ValueError, UnicodeDecodeError, IndexError):
+        # Unreadable outputs are converted again
+        return False
+
+
+def convert_file(input_file, output_file, output_format = "BINARY", precision = None):
+    """
+    Convert one point cloud file, writing the output atomically
+
+    Parameters:
+        input_file (string) : Name and Path to the KITTI or PCD file to be read
+        output_file (string) : Name and Path to the file to be written
+        output_format (string) : "ASCII", "BINARY", "BINARY_COMPRESSED" or "KITTI"
+        precision (float) : Quantize coordinates to int32 with this precision,
+            PCD output only, None to keep the input types
+
+    Returns:
+        (num_points, input_bytes, output_bytes)
+
+    Exceptions:
+        IOError: if a file cannot be read or written
+        TypeError:  if datatype in PCD file is not recognized
+        ValueError: invalid input parameter
+    """
+    if output_format not in output_formats:
+        raise ValueError("output_format must be one of " + ", ".join(output_formats))
+
+    point_cloud = PointCloud()
+    if input_file.lower().endswith(".bin"):
+        point_cloud.read_kitti_file(input_file)
+    else:
+        point_cloud.read_pcd_file(input_file)
+
+    if precision is not None and output_format != "KITTI":
+        point_cloud.quantize(precision)
+
+    output_dir = os.path.dirname(output_file)
+    os.makedirs(output_dir or ".", exist_ok = True)
+    # Temporary file in the output directory, so that the rename is atomic
+    temp_file = os.path.join(output_dir, "." + os.path.basename(output_file) + "." + str(os.getpid()) + ".tmp")
+
+    try:
+        if output_format == "KITTI":
+            points = np.empty((point_cloud.num_points, 4), dtype = np.float32)
+            points[:, :3] = point_cloud.points_array
+            if len(point_cloud.intensity_array) > 0:
+                points[:, 3] = point_cloud.intensity_array
+            else:
+                points[:, 3] = 0.0
+            points.tofile(temp_file)
+        else:
+            point_cloud.write_pcd_file(temp_file, output_format)
+        os.replace(temp_file, output_file)
+
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+    return (point_cloud.num_points, os.path.getsize(input_file), os.path.getsize(output_file))
+
+
+def _convert_task(task):
+    """ Convert a file in a worker process, returning errors instead of raising them """
+
+    (input_file, output_file, output_format, precision) = task
+    try:
+        return (input_file, convert_file(input_file, output_file, output_format, precision), None)
+    except (IOError, TypeError, ValueError, UnicodeDecodeError, IndexError, ImportError) as error:
+        return (input_file, None, repr(error))
+
+
+def convert_directory(input_dir, output_dir, output_format = "BINARY", max_workers = None, force = False,
+        precision = None, bPrint = False):
+    """
+    Convert all KITTI and PCD files under a directory in parallel
+
+    Parameters:
+        input_dir (string) : Root directory of the input files, searched recursively
+        output_dir (string) : Root directory of the output files
+        output_format (string) : "ASCII", "BINARY", "BINARY_COMPRESSED" or "KITTI"
+        max_workers (int) : Number of worker processes, None for the number of CPUs
+        force (bool) : Convert also files whose output is up to date, see is_up_to_date
+        precision (float) : Quantize coordinates with this precision, see convert_file
+        bPrint (bool) : Print progress and the summary
+
+    Returns:
+        stats (dict) : 'converted', 'skipped', 'failed' (list of (file, error)),
+            'points', 'input_bytes', 'output_bytes' and 'seconds'
+
+    Exceptions:
+        ValueError: invalid input parameter
+    """
+    if output_format not in output_formats:
+        raise ValueError("output_format must be one of " + ", ".join(output_formats))
+
+    start_time = time.perf_counter()
+
+    # Find files whose output is missing, older than the input or written with other settings
+    tasks = []
+    num_skipped = 0
+    for (root, dirs, files) in os.walk(input_dir):
+        dirs.sort()
+        for file_name in sorted(files):
+            if not file_name.lower().endswith(input_extensions):
+                continue
+            input_file = os.path.join(root, file_name)
+            output_file = get_output_file(input_file, input_dir, output_dir, output_format)
+            if not force and is_up_to_date(input_file, output_file, output_format, precision):
+                num_skipped += 1
+                continue
+            tasks.append((input_file, output_file, output_format, precision))
+
+    stats = { "converted": 0, "skipped": num_skipped, "failed": [], "points": 0,
+        "input_bytes": 0, "output_bytes": 0, "seconds": 0.0 }
+
+    if tasks:
+        max_workers = max_workers or os.cpu_count() or 1
+        # Batches of tasks per worker message, small files would otherwise be bound by the messaging
+        chunksize = max(1, min(64, len(tasks) // (max_workers * 8)))
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            for (input_file, result, error) in executor.map(_convert_task, tasks, chunksize = chunksize):
+                if result is None:
+                    stats["failed"].append((input_file, error))
+                    if bPrint:
+                        print("[ERROR]: Could not convert file '" + input_file + "': " + error)
+                    continue
+                stats["converted"] += 1
+                stats["points"] += result[0]
+                stats["input_bytes"] += result[1]
+                stats["output_bytes"] += result[2]
+
+    stats["seconds"] = time.perf_counter() - start_time
+
+    if bPrint:
+        seconds = max(stats["seconds"], 1e-9)
+        print(f"Converted {stats['converted']} files, skipped {stats['skipped']} up to date files, "
+            f"{len(stats['failed'])} failed")
+        print(f"{stats['seconds']:.2f} s, {stats['converted'] / seconds:.1f} files/s, "
+            f"{stats['points'] / seconds / 1e6:.2f} Mpts/s, {stats['input_bytes'] / seconds / 1e6:.1f} MB/s read, "
+            f"{stats['output_bytes'] / seconds / 1e6:.1f} MB/s written")
+
+    return stats
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Convert KITTI and PCD files in parallel")
+    parser.add_argument("input_dir", help = "Directory of the input files, searched recursively")
+    parser.add_argument("output_dir", help = "Directory of the output files")
+    parser.add_argument("--format", default = "BINARY", choices = output_formats, help = "Output format")
+    parser.add_argument("--workers", type = int, default = None, help = "Worker processes, default number of CPUs")
+    parser.add_argument("--precision", type = float, default = None, help = "Quantize coordinates, e.g. 0.001")
+    parser.add_argument("--force", action = "store_true", help = "Convert also up to date files")
+    args = parser.parse_args()
+
+    stats = convert_directory(args.input_dir, args.output_dir, args.format, args.workers, args.force,
+        args.precision, bPrint = True)
+    if stats["failed"]:
+        raise SystemExit(1)
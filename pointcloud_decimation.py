@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Decimation
+
+    Reduce point clouds to a target number of points or a ratio of the
+    input with random, voxel based uniform or farthest point sampling.
+    All samplers take a PointCloud object or a points array and return
+    indices of the selected points, without duplicates.
+
+    Author: Jari Honkanen
+
+"""
+
+import numpy as np
+from pointcloud_filters import get_points, get_voxel_keys, group_voxels
+
+
+def get_target_count(num_points, count = None, ratio = None):
+    """
+    Get number of points to keep from a count or a ratio
+
+    Parameters:
+        num_points (int) : Number of input points
+        count (int) : Number of points to keep
+        ratio (float) : Ratio of points to keep, used when count is None
+
+    Returns:
+        Number of points to keep, at most num_points
+
+    Exceptions:
+        ValueError: if neither count nor ratio is given
+    """
+    if count is None and ratio is None:
+        raise ValueError("count or ratio must be given")
+    if count is None:
+        count = int(num_points * ratio)
+
+    return max(0, min(int(count), num_points))
+
+
+def random_sample(point_cloud, count = None, ratio = None, seed = None):
+    """
+    Random sampling without replacement
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        count (int) : Number of points to keep
+        ratio (float) : Ratio of points to keep, used when count is None
+        seed (int) : Random seed, None for a different sample each call
+
+    Returns:
+        Numpy Array of sorted point indices
+    """
+    num_points = len(get_points(point_cloud))
+    count = get_target_count(num_points, count, ratio)
+    rng = np.random.default_rng(seed)
+
+    return np.sort(rng.choice(num_points, size = count, replace = False))
+
+
+def voxel_sample(point_cloud, count = None, ratio = None, seed = None, iterations = 16):
+    """
+    Spatially uniform sampling, at most one point per voxel
+
+    The voxel size is chosen with a binary search so that there are at
+    least count occupied voxels. One random point of each voxel is a
+    candidate and count candidates are kept at random.
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        count (int) : Number of points to keep
+        ratio (float) : Ratio of points to keep, used when count is None
+        seed (int) : Random seed
+        iterations (int) : Number of binary search steps for the voxel size
+
+    Returns:
+        Numpy Array of sorted point indices
+    """
+    points = get_points(point_cloud)[:, :3]
+    num_points = len(points)
+    count = get_target_count(num_points, count, ratio)
+    rng = np.random.default_rng(seed)
+    if count == 0 or count == num_points:
+        return np.arange(count)
+
+    # Random order, so that the first point of each voxel is a random point
+    shuffled = rng.permutation(num_points)
+    shuffled_points = points[shuffled]
+    origin = np.min(shuffled_points, axis = 0)
+
+    # Binary search for the largest voxel with at least count occupied voxels
+    extent = float(np.max(np.max(shuffled_points, axis = 0) - origin))
+    if extent <= 0.0:
+        # All points coincide, every voxel size gives one voxel
+        return np.sort(rng.choice(num_points, size = count, replace = False))
+    lower = extent / (2 ** 19)
+    upper = max(extent, lower)
+    candidates = None
+    for i in range(iterations):
+        voxel_size = np.sqrt(lower * upper)
+        (order, starts, counts) = group_voxels(get_voxel_keys(shuffled_points, voxel_size, origin))
+        if len(starts) >= count:
+            lower = voxel_size
+            candidates = np.minimum.reduceat(order, starts)
+        else:
+            upper = voxel_size
+
+    if candidates is None:
+        (order, starts, counts) = group_voxels(get_voxel_keys(shuffled_points, lower, origin))
+        candidates = np.minimum.reduceat(order, starts)
+        if len(candidates) < count:
+            candidates = np.arange(num_points)
+
+    selected = rng.choice(candidates, size = count, replace = False)
+
+    return np.sort(shuffled[selected])
+
+
+def spread_bits(values):
+    """ Spread the lowest 10 bits of integers to every third bit """
+
+    values = values & 0x3ff
+    values = (values | (values << 16)) & 0x30000ff
+    values = (values | (values << 8)) & 0x300f00f
+    values = (values | (values << 4)) & 0x30c30c3
+    values = (values | (values << 2)) & 0x9249249
+
+    return values
+
+
+def get_morton_order(points):
+    """ Return sort order of points along a Morton (Z-order) curve with 10 bits per axis """
+
+    lower = np.min(points, axis = 0)
+    extent = max(float(np.max(np.max(points, axis = 0) - lower)), 1e-12)
+    coords = ((points - lower) * (1023.0 / extent)).astype(np.int64)
+    code = spread_bits(coords[:, 0]) | (spread_bits(coords[:, 1]) << 1) | (spread_bits(coords[:, 2]) << 2)
+
+    return np.argsort(code)
+
+
+def farthest_point_sample(point_cloud, count = None, ratio = None, seed = 0, chunk_points = 4096):
+    """
+    Farthest point sampling in spatially coherent chunks
+
+    Points are split along a Morton curve into chunks of chunk_points
+    points. Farthest point sampling runs in all chunks at once, each chunk
+    contributing its share of count. Use chunk_points >= N for exact
+    farthest point sampling over the whole cloud.
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        count (int) : Number of points to keep
+        ratio (float) : Ratio of points to keep, used when count is None
+        seed (int) : Random seed of the first point in each chunk
+        chunk_points (int) : Number of points in each chunk
+
+    Returns:
+        Numpy Array of sorted point indices
+    """
+    points = get_points(point_cloud)[:, :3].astype(np.float32)
+    num_points = len(points)
+    count = get_target_count(num_points, count, ratio)
+    if count == 0 or count == num_points:
+        return np.arange(count)
+
+    num_chunks = max(1, int(np.ceil(num_points / chunk_points)))
+    chunk_size = int(np.ceil(num_points / num_chunks))
+    order = get_morton_order(points) if num_chunks > 1 else np.arange(num_points)
+
+    # Chunks as rows of a padded matrix
+    padded = num_chunks * chunk_size
+    order = np.r_[order, np.full(padded - num_points, -1)].reshape(num_chunks, chunk_size)
+    valid = order >= 0
+    # One (chunks, chunk_size) matrix per coordinate
+    (x, y, z) = [np.where(valid, points[np.maximum(order, 0), axis], 0.0).astype(np.float32) for axis in range(3)]
+
+    # Share of count for each chunk, proportional to its number of points
+    sizes = np.sum(valid, axis = 1)
+    shares = sizes * count / num_points
+    targets = np.floor(shares).astype(np.int64)
+    remainder = count - int(np.sum(targets))
+    targets[np.argsort(targets - shares)[:remainder]] += 1
+
+    rng = np.random.default_rng(seed)
+    rows = np.arange(num_chunks)
+    current = (rng.random(num_chunks) * sizes).astype(np.int64)
+    min_distances = np.where(valid, np.inf, -np.inf).astype(np.float32)
+    distances = np.empty_like(min_distances)
+    difference = np.empty_like(min_distances)
+    selected = []
+
+    for step in range(int(np.max(targets))):
+        active = targets > step
+        selected.append(order[rows[active], current[active]])
+
+        # Distance of every point to the newest selected point of its chunk
+        np.subtract(x, x[rows, current][:, np.newaxis], out = distances)
+        np.multiply(distances, distances, out = distances)
+        for axis in (y, z):
+            np.subtract(axis, axis[rows, current][:, np.newaxis], out = difference)
+            np.multiply(difference, difference, out = difference)
+            np.add(distances, difference, out = distances)
+        np.minimum(min_distances, distances, out = min_distances)
+        # Selected points are never picked again, even among duplicate points
+        min_distances[rows, current] = -1.0
+        current = np.argmax(min_distances, axis = 1)
+
+    return np.sort(np.concatenate(selected))
+
+
+def get_example_point_cloud(decimateFactor = 0.05, seed = 0):
+    """ Create numpy array of points from PyVista LiDAR example """
+
+    from pyvista import examples
+
+    # Get PyVista Lidar Example Data
+    print("Downloading PyVista LiDAR Example data ...")
+    dataset = examples.download_lidar()
+    print(f"Downloading complete. Downloaded {dataset.n_points} points.")
+    # Get random points from the dataset, without duplicates
+    pointIds = random_sample(dataset.points, ratio=decimateFactor, seed=seed)
+    print(f"Number of points after decimation: {len(pointIds)}")
+
+    return dataset.points[pointIds]
+
+
+def decimate(point_cloud, count = None, ratio = None, method = "random", seed = None):
+    """
+    Decimate point cloud
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3+) of points
+        count (int) : Number of points to keep
+        ratio (float) : Ratio of points to keep, used when count is None
+        method (string) : "random", "voxel" or "fps"
+        seed (int) : Random seed
+
+    Returns:
+        Numpy Array of the kept points
+
+    Exceptions:
+        ValueError: invalid input parameter
+    """
+    if method == "random":
+        indices = random_sample(point_cloud, count, ratio, seed)
+    elif method == "voxel":
+        indices = voxel_sample(point_cloud, count, ratio, seed)
+    elif method == "fps":
+        indices = farthest_point_sample(point_cloud, count, ratio, 0 if seed is None else seed)
+    else:
+        raise ValueError("method must be 'random', 'voxel' or 'fps'")
+
+    return get_points(point_cloud)[indices]
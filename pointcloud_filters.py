@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Filters
+
+    Voxel grid downsampling that works directly on NumPy point arrays,
+    either on a whole cloud or chunk by chunk on streamed input, and
+    statistical and radius outlier removal in spatial chunks.
+
+    Author: Jari Honkanen
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from pointcloud_index import VoxelGridIndex
+
+# Voxel coordinates are packed into a single int64 key with 21 bits per axis
+KEY_BITS = 21
+KEY_OFFSET = 1 << (KEY_BITS - 1)
+KEY_MASK = (1 << KEY_BITS) - 1
+
+
+def get_points(point_cloud):
+    """ Return (N, 3+) points array of a PointCloud object or an array """
+
+    if hasattr(point_cloud, "points_array"):
+        return np.asarray(point_cloud.points_array)
+
+    return np.asarray(point_cloud)
+
+
+def get_voxel_keys(points, voxel_size, origin = (0.0, 0.0, 0.0)):
+    """
+    Quantize points to packed integer voxel keys
+
+    Parameters:
+        points : Numpy Array (N, 3) of points
+        voxel_size (float) : Voxel edge length
+        origin : Corner of the voxel grid
+
+    Returns:
+        Numpy Array (N,) of int64 keys
+
+    Exceptions:
+        ValueError: if the points span more than 2^21 voxels along an axis
+    """
+    # Quantize in the precision of the input points
+    dtype = points.dtype if points.dtype.kind == "f" else np.float64
+    scaled = (points[:, :3] - np.asarray(origin, dtype = dtype)) * dtype.type(1.0 / voxel_size)
+    coords = np.floor(scaled).astype(np.int64) + KEY_OFFSET
+    if len(coords) > 0 and (np.min(coords) < 0 or np.max(coords) > KEY_MASK):
+        raise ValueError("Points span too many voxels, increase voxel_size")
+
+    return (coords[:, 0] << (2 * KEY_BITS)) | (coords[:, 1] << KEY_BITS) | coords[:, 2]
+
+
+def group_voxels(keys):
+    """
+    Group voxel keys with a sort
+
+    Parameters:
+        keys : Numpy Array (N,) of voxel keys
+
+    Returns:
+        (order, starts, counts) : Sort order of the points, start of each
+            voxel in the sorted order and number of points in each voxel.
+            Order within a voxel is arbitrary
+    """
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+
+    return (order, starts, counts)
+
+
+def voxel_grid_filter(point_cloud, voxel_size, mode = "centroid", origin = (0.0, 0.0, 0.0)):
+    """
+    Downsample points to one point per occupied voxel
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        voxel_size (float) : Voxel edge length
+        mode (string) : "centroid" for the mean of the points in each voxel,
+            "first" for the first point in each voxel
+        origin : Corner of the voxel grid
+
+    Returns:
+        (points, counts) : Numpy Array (V, 3) of voxel points and Numpy
+            Array (V,) of number of input points in each voxel
+
+    Exceptions:
+        ValueError: invalid input parameter
+    """
+    if mode not in ("centroid", "first"):
+        raise ValueError("mode must be 'centroid' or 'first'")
+
+    points = get_points(point_cloud)[:, :3]
+    if len(points) == 0:
+        return (np.zeros((0, 3), dtype = points.dtype), np.zeros(0, dtype = np.int64))
+
+    keys = get_voxel_keys(points, voxel_size, origin)
+    (order, starts, counts) = group_voxels(keys)
+
+    if mode == "first":
+        # Smallest input index in each voxel
+        return (points[np.minimum.reduceat(order, starts)], counts)
+
+    sums = np.add.reduceat(points[order], starts, axis = 0, dtype = np.float64)
+    centroids = sums / counts[:, np.newaxis]
+    if points.dtype.kind == "f":
+        centroids = centroids.astype(points.dtype)
+
+    return (centroids, counts)
+
+
+class VoxelGridFilter:
+    """ Chunked voxel grid filter for streamed input """
+
+    def __init__(self, voxel_size, mode = "centroid", origin = (0.0, 0.0, 0.0)):
+        """
+        Parameters:
+            voxel_size (float) : Voxel edge length
+            mode (string) : "centroid" or "first", see voxel_grid_filter
+            origin : Corner of the voxel grid, same for all chunks
+
+        Exceptions:
+            ValueError: invalid input parameter
+        """
+        if mode not in ("centroid", "first"):
+            raise ValueError("mode must be 'centroid' or 'first'")
+        self.voxel_size = voxel_size
+        self.mode = mode
+        self.origin = origin
+        # Voxel values and counts in order of first appearance, with spare capacity
+        self.num_voxels = 0
+        self.values = np.zeros((0, 3))
+        self.counts = np.zeros(0, dtype = np.int64)
+        # Index from voxel key to slot, as sorted runs of (keys, slots) of
+        # decreasing size. A run is merged with the next one when they are of
+        # similar size, so a key is found with a few binary searches
+        self.runs = []
+        # Type of the input points, results are returned in it as by voxel_grid_filter
+        self.dtype = None
+
+
+    def add(self, point_cloud):
+        """
+        Add chunk of points
+
+        Parameters:
+            point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        """
+        points = get_points(point_cloud)[:, :3]
+        if len(points) == 0:
+            return
+        self.dtype = points.dtype if self.dtype is None else np.result_type(self.dtype, points.dtype)
+
+        # Only the chunk is sorted, earlier voxels are looked up in the runs
+        keys = get_voxel_keys(points, self.voxel_size, self.origin)
+        (order, starts, counts) = group_voxels(keys)
+        keys = keys[order[starts]]
+        if self.mode == "centroid":
+            # Keep sums so that centroids can be merged across chunks
+            values = np.add.reduceat(points[order].astype(np.float64), starts, axis = 0)
+        else:
+            values = points[np.minimum.reduceat(order, starts)].astype(np.float64)
+
+        slots = np.full(len(keys), -1, dtype = np.int64)
+        for (run_keys, run_slots) in self.runs:
+            positions = np.minimum(np.searchsorted(run_keys, keys), len(run_keys) - 1)
+            found = run_keys[positions] == keys
+            slots[found] = run_slots[positions[found]]
+
+        # Voxels of earlier chunks keep their first point of the stream
+        found = slots >= 0
+        self.counts[slots[found]] += counts[found]
+        if self.mode == "centroid":
+            self.values[slots[found]] += values[found]
+
+        new = np.flatnonzero(~found)
+        if len(new) == 0:
+            return
+
+        # Append new voxels, growing the storage geometrically
+        end = self.num_voxels + len(new)
+        if end > len(self.counts):
+            capacity = max(end, 2 * len(self.counts))
+            self.values = np.concatenate((self.values[:self.num_voxels], np.zeros((capacity - self.num_voxels, 3))))
+            self.counts = np.concatenate((self.counts[:self.num_voxels],
+                np.zeros(capacity - self.num_voxels, dtype = np.int64)))
+        self.values[self.num_voxels:end] = values[new]
+        self.counts[self.num_voxels:end] = counts[new]
+
+        run = (keys[new], np.arange(self.num_voxels, end))
+        self.num_voxels = end
+        while self.runs and len(self.runs[-1][0]) <= 2 * len(run[0]):
+            (run_keys, run_slots) = self.runs.pop()
+            merged_keys = np.concatenate((run_keys, run[0]))
+            merge_order = np.argsort(merged_keys, kind = "stable")
+            run = (merged_keys[merge_order], np.concatenate((run_slots, run[1]))[merge_order])
+        self.runs.append(run)
+
+
+    def result(self):
+        """
+        Get filtered points of all chunks added so far
+
+        Returns:
+            (points, counts) : Numpy Array (V, 3) of voxel points and Numpy
+                Array (V,) of number of input points in each voxel, in voxel key order
+        """
+        if self.dtype is None:
+            return (np.zeros((0, 3)), np.zeros(0, dtype = np.int64))
+
+        # Slots in key order, as voxel_grid_filter returns them
+        keys = np.concatenate([run_keys for (run_keys, run_slots) in self.runs])
+        slots = np.concatenate([run_slots for (run_keys, run_slots) in self.runs])[np.argsort(keys)]
+        counts = self.counts[slots]
+
+        if self.mode == "centroid":
+            centroids = self.values[slots] / np.maximum(counts, 1)[:, np.newaxis]
+            if self.dtype.kind == "f":
+                centroids = centroids.astype(self.dtype)
+            return (centroids, counts)
+
+        return (self.values[slots].astype(self.dtype), counts)
+
+
+def get_spatial_chunks(points, chunk_points):
+    """
+    Split points into spatially coherent chunks by recursive median splits
+
+    Parameters:
+        points : Numpy Array (N, 3) of points
+        chunk_points (int) : Maximum number of points in a chunk
+
+    Returns:
+        list of Numpy Arrays of point indices
+    """
+    chunks = []
+    stack = [np.arange(len(points))]
+    while stack:
+        indices = stack.pop()
+        if len(indices) <= chunk_points:
+            chunks.append(indices)
+            continue
+        # Split the widest axis at the median
+        chunk = points[indices]
+        axis = np.argmax(np.max(chunk, axis = 0) - np.min(chunk, axis = 0))
+        half = len(indices) // 2
+        order = np.argpartition(chunk[:, axis], half)
+        stack.append(indices[order[half:]])
+        stack.append(indices[order[:half]])
+
+    return chunks
+
+
+class _ChunkRegions:
+    """ Finds points within a halo of a chunk from the bounding boxes of all chunks """
+
+    def __init__(self, points, chunks):
+        # Points grouped by chunk, so that the points of a chunk are a slice
+        self.points = points
+        self.chunk_points = points[np.concatenate(chunks)]
+        self.chunk_starts = np.cumsum([0] + [len(indices) for indices in chunks])
+        self.chunk_lower = np.array([np.min(points[indices], axis = 0) for indices in chunks], dtype = np.float64)
+        self.chunk_upper = np.array([np.max(points[indices], axis = 0) for indices in chunks], dtype = np.float64)
+        self.cloud_lower = np.min(self.chunk_lower, axis = 0)
+        self.cloud_upper = np.max(self.chunk_upper, axis = 0)
+
+
+    def get_region(self, indices, halo):
+        """
+        Get points within halo of the bounding box of a chunk
+
+        Only the chunks whose bounding boxes overlap the region are
+        searched, so the cost follows the region size, not the cloud size.
+
+        Returns:
+            (region_points, lower, upper) : float64 Numpy Array of the region
+                points and region bounds, infinite on sides that reach past the whole cloud
+        """
+        # Bounds in float64, so that the halo is not rounded to the precision of the points
+        lower = np.min(self.points[indices], axis = 0).astype(np.float64) - halo
+        upper = np.max(self.points[indices], axis = 0).astype(np.float64) + halo
+        near = np.flatnonzero(np.all((self.chunk_lower <= upper) & (self.chunk_upper >= lower), axis = 1))
+
+        region = []
+        for i in near:
+            candidates = self.chunk_points[self.chunk_starts[i]:self.chunk_starts[i + 1]]
+            # Test only the axes along which the chunk reaches out of the region
+            inside = None
+            for axis in np.flatnonzero((self.chunk_lower[i] < lower) | (self.chunk_upper[i] > upper)):
+                values = candidates[:, axis]
+                axis_inside = (values >= lower[axis]) & (values <= upper[axis])
+                inside = axis_inside if inside is None else inside & axis_inside
+            region.append(candidates if inside is None else candidates[inside])
+        lower = np.where(lower <= self.cloud_lower, -np.inf, lower)
+        upper = np.where(upper >= self.cloud_upper, np.inf, upper)
+
+        return (np.concatenate(region).astype(np.float64), lower, upper)
+
+
+def _knn_mean_distance_task(task):
+    """ Mean distance of query points to their k nearest other points within a region """
+
+    (region_points, queries, lower, upper, k) = task
+    (indices, distances) = VoxelGridIndex(region_points).query_knn(queries, k + 1)
+
+    # The nearest neighbor is the point itself. Summed column by column,
+    # so that the result does not depend on the number of queries
+    total = np.zeros(len(queries))
+    for column in range(1, k + 1):
+        total += distances[:, column]
+
+    # Exact when the ball of the k-th neighbor lies inside the region
+    margin = np.min(np.minimum(queries - lower, upper - queries), axis = 1)
+    exact = distances[:, k] <= margin
+
+    return (total / k, exact)
+
+
+def _radius_count_task(task):
+    """ Number of other points within radius of query points """
+
+    (region_points, queries, radius) = task
+    (indices, offsets) = VoxelGridIndex(region_points).query_radius(queries, radius)
+
+    return np.diff(offsets) - 1
+
+
+def _map_chunks(function, tasks, max_workers):
+    """ Map function over a generator of tasks, in worker processes when max_workers > 1 """
+
+    if max_workers is None or max_workers <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+
+    with ProcessPoolExecutor(max_workers = max_workers) as executor:
+        # Limit tasks in flight, so that memory use is bounded by a few chunks
+        pending = []
+        for task in tasks:
+            pending.append(executor.submit(function, task))
+            if len(pending) > 2 * max_workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def statistical_outlier_removal(point_cloud, k = 16, std_ratio = 1.0, chunk_points = None, max_workers = 1):
+    """
+    Remove points whose mean distance to their k nearest neighbors is large
+
+    A point is an outlier when its mean neighbor distance is more than
+    std_ratio standard deviations above the mean over all points.
+    Chunks are processed with a halo of neighboring points. Points whose
+    neighbors may lie outside the halo are processed again with a larger
+    halo, so the result is the same as without chunks.
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        k (int) : Number of neighbors
+        std_ratio (float) : Threshold in standard deviations
+        chunk_points (int) : Number of points in each chunk, None for a single pass
+        max_workers (int) : Number of worker processes, 1 to process chunks in this process
+
+    Returns:
+        Boolean Numpy Array (N,) inlier mask
+    """
+    # Points are converted to float64 region by region, not as a whole
+    points = get_points(point_cloud)[:, :3]
+    num_points = len(points)
+    if num_points == 0:
+        return np.zeros(0, dtype = bool)
+
+    # A point has at most num_points - 1 neighbors
+    k = min(k, num_points - 1)
+    if k < 1:
+        return np.ones(num_points, dtype = bool)
+
+    mean_distances = np.zeros(num_points)
+    if chunk_points is None or chunk_points >= num_points:
+        infinite = np.full(3, np.inf)
+        points = np.asarray(points, dtype = np.float64)
+        (mean_distances[:], exact) = _knn_mean_distance_task((points, points, -infinite, infinite, k))
+    else:
+        chunks = get_spatial_chunks(points, chunk_points)
+        regions = _ChunkRegions(points, chunks)
+        extent = regions.cloud_upper - regions.cloud_lower
+
+        # Initial halo from the point spacing over the non-flat axes
+        axes = extent > 0
+        spacing = (np.prod(extent[axes]) / num_points) ** (1.0 / max(1, np.count_nonzero(axes))) if np.any(axes) else 0.0
+        halo = max(2.0 * spacing * (k + 1) ** (1.0 / 3.0), 1e-9)
+
+        pending = chunks
+        while pending:
+            def create_tasks(chunks, halo = halo):
+                for indices in chunks:
+                    (region_points, lower, upper) = regions.get_region(indices, halo)
+                    yield (region_points, points[indices].astype(np.float64), lower, upper, k)
+
+            retry = []
+            for (indices, (means, exact)) in zip(pending, _map_chunks(_knn_mean_distance_task, create_tasks(pending), max_workers)):
+                mean_distances[indices] = means
+                if not np.all(exact):
+                    retry.append(indices[~exact])
+            pending = retry
+            halo *= 2.0
+
+    threshold = np.mean(mean_distances) + std_ratio * np.std(mean_distances)
+
+    return mean_distances <= threshold
+
+
+def radius_outlier_removal(point_cloud, radius, min_neighbors = 2, chunk_points = None, max_workers = 1):
+    """
+    Remove points with fewer than min_neighbors other points within radius
+
+    Chunks are processed with a halo of radius, which contains every
+    neighbor of the chunk points, so the result is the same as without chunks.
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        radius (float) : Search radius
+        min_neighbors (int) : Minimum number of other points within radius
+        chunk_points (int) : Number of points in each chunk, None for a single pass
+        max_workers (int) : Number of worker processes, 1 to process chunks in this process
+
+    Returns:
+        Boolean Numpy Array (N,) inlier mask
+    """
+    # Points are converted to float64 region by region, not as a whole
+    points = get_points(point_cloud)[:, :3]
+    num_points = len(points)
+    if num_points == 0:
+        return np.zeros(0, dtype = bool)
+
+    if chunk_points is None or chunk_points >= num_points:
+        points = np.asarray(points, dtype = np.float64)
+        return _radius_count_task((points, points, radius)) >= min_neighbors
+
+    # Margin for rounding in the squared distances
+    halo = radius * (1.0 + 1e-6)
+    chunks = get_spatial_chunks(points, chunk_points)
+    regions = _ChunkRegions(points, chunks)
+
+    def create_tasks():
+        for indices in chunks:
+            (region_points, lower, upper) = regions.get_region(indices, halo)
+            yield (region_points, points[indices].astype(np.float64), radius)
+
+    counts = np.zeros(num_points, dtype = np.int64)
+    for (indices, chunk_counts) in zip(chunks, _map_chunks(_radius_count_task, create_tasks(), max_workers)):
+        counts[indices] = chunk_counts
+
+    return counts >= min_neighbors
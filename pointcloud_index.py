@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Spatial Index
+
+    Voxel hash grid for radius and k-nearest-neighbor queries. Points are
+    sorted by voxel key so that the points of every occupied voxel are
+    stored next to each other, and queries look up neighboring voxels with
+    binary search. All queries are batched and vectorized with NumPy.
+
+    Author: Jari Honkanen
+
+"""
+
+import numpy as np
+
+# Number of candidate (query, point) pairs processed at once, bounds temporary memory use
+CANDIDATE_BUDGET = 4000000
+
+# Maximum number of voxel size reductions for clustered points
+MAX_CELL_SIZE_REFINEMENTS = 3
+
+
+class VoxelGridIndex:
+    """ Voxel hash grid spatial index over an (N, 3) array of points """
+
+    def __init__(self, points, cell_size = None):
+        """
+        Build spatial index
+
+        Parameters:
+            points : Numpy Array (N, 3) of points
+            cell_size (float) : Voxel edge length, None to choose it from the point density
+
+        Exceptions:
+            ValueError: invalid input parameter
+        """
+        self.points = np.asarray(points)
+        if self.points.ndim != 2 or self.points.shape[1] < 3:
+            raise ValueError("points must be an (N, 3) array")
+        xyz = self.points[:, :3].astype(np.float64)
+        self.num_points = len(xyz)
+
+        if self.num_points > 0:
+            self.origin = np.min(xyz, axis = 0)
+            extent = np.max(xyz, axis = 0) - self.origin
+        else:
+            self.origin = np.zeros(3)
+            extent = np.zeros(3)
+
+        if cell_size is None:
+            cell_size = self._choose_cell_size(xyz, extent)
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self.cell_size = float(cell_size)
+
+        self.dims = (np.floor(extent / self.cell_size).astype(np.int64) + 1)
+
+        # Sort points by voxel key, one run of points per occupied voxel
+        keys = self._linear_keys(self._cell_coords(xyz))
+        self.order = np.argsort(keys, kind = "stable")
+        (self.cell_keys, self.cell_starts, self.cell_counts) = np.unique(keys[self.order],
+            return_index = True, return_counts = True)
+        self.sorted_points = xyz[self.order]
+        self.sorted_axes = [np.ascontiguousarray(self.sorted_points[:, axis]) for axis in range(3)]
+
+
+    def _choose_cell_size(self, xyz, extent):
+        """ Choose voxel edge length for about eight points per voxel """
+
+        # Start from a uniformly filled bounding box, over the non-flat axes
+        # so that planar scans do not get tiny voxels
+        axes = extent > 1e-6 * np.max(extent)
+        if not np.any(axes):
+            return 1.0
+        volume = np.prod(extent[axes])
+        cell_size = (8.0 * volume / max(self.num_points, 1)) ** (1.0 / np.count_nonzero(axes))
+
+        # Clustered points fill few voxels, shrink the voxels while the
+        # average point shares its voxel with many points
+        for i in range(MAX_CELL_SIZE_REFINEMENTS):
+            dims = np.floor(extent / cell_size).astype(np.int64) + 1
+            coords = np.floor((xyz - self.origin) / cell_size).astype(np.int64)
+            counts = np.unique((coords[:, 0] * dims[1] + coords[:, 1]) * dims[2] + coords[:, 2], return_counts = True)[1]
+            occupancy = np.sum(counts.astype(np.float64) ** 2) / max(self.num_points, 1)
+            if occupancy <= 4.0 * 8.0:
+                break
+            smaller = cell_size * (8.0 / occupancy) ** (1.0 / 3.0)
+            # Linear voxel keys must fit int64
+            if np.prod((np.floor(extent / smaller) + 1).astype(np.float64)) >= 2.0 ** 62:
+                break
+            cell_size = smaller
+
+        return cell_size
+
+
+    def _cell_coords(self, xyz):
+        return np.floor((xyz - self.origin) / self.cell_size).astype(np.int64)
+
+
+    def _linear_keys(self, coords):
+        return (coords[:, 0] * self.dims[1] + coords[:, 1]) * self.dims[2] + coords[:, 2]
+
+
+    def _is_exhaustive(self, ring):
+        """ True when a ring of voxels is larger than the number of occupied voxels """
+        return (2 * ring + 1) ** 3 >= len(self.cell_keys)
+
+
+    def _query_chunk_size(self, ring):
+        """ Number of queries per batch that keeps candidate pairs within CANDIDATE_BUDGET """
+        if self._is_exhaustive(ring):
+            candidates = self.num_points
+        else:
+            candidates = (2 * ring + 1) ** 3 * max(1, self.num_points // len(self.cell_keys))
+        return max(1, CANDIDATE_BUDGET // candidates)
+
+
+    def _gather_candidates(self, queries, ring):
+        """ Return (query index, sorted point position) pairs from the voxels within ring voxels of each query """
+
+        if self._is_exhaustive(ring):
+            # Looking up voxels would cost more than comparing against all points
+            query_ids = np.repeat(np.arange(len(queries)), self.num_points)
+            positions = np.tile(np.arange(self.num_points), len(queries))
+            return (query_ids, positions)
+
+        coords = self._cell_coords(queries)
+        steps = np.arange(-ring, ring + 1)
+        offsets = np.stack(np.meshgrid(steps, steps, steps, indexing = "ij"), axis = -1).reshape(-1, 3)
+
+        # Neighbor voxel coordinates of every query, (M * num_offsets, 3)
+        neighbors = (coords[:, np.newaxis, :] + offsets[np.newaxis, :, :]).reshape(-1, 3)
+        query_ids = np.repeat(np.arange(len(queries)), len(offsets))
+        inside = np.all((neighbors >= 0) & (neighbors < self.dims), axis = 1)
+        neighbors = neighbors[inside]
+        query_ids = query_ids[inside]
+
+        keys = self._linear_keys(neighbors)
+        cells = np.searchsorted(self.cell_keys, keys)
+        cells = np.minimum(cells, len(self.cell_keys) - 1)
+        found = self.cell_keys[cells] == keys
+        cells = cells[found]
+        query_ids = query_ids[found]
+
+        # Expand each (query, voxel) pair into one entry per point in the voxel
+        counts = self.cell_counts[cells]
+        total = int(np.sum(counts))
+        run_starts = np.cumsum(counts) - counts
+        positions = np.repeat(self.cell_starts[cells] - run_starts, counts) + np.arange(total)
+
+        return (np.repeat(query_ids, counts), positions)
+
+
+    def _squared_distances(self, queries, query_ids, positions):
+        """ Squared distances of (query, point) pairs grouped by ascending query index """
+
+        # Gathers from contiguous per-axis arrays are faster than gathering
+        # (N, 3) rows, and grouped query coordinates are repeated, not gathered
+        query_counts = np.bincount(query_ids, minlength = len(queries))
+        squared = np.zeros(len(positions))
+        for axis in range(3):
+            difference = self.sorted_axes[axis][positions]
+            difference -= np.repeat(queries[:, axis], query_counts)
+            difference *= difference
+            squared += difference
+
+        return squared
+
+
+    def query_radius(self, queries, radius):
+        """
+        Find all points within radius of each query point
+
+        Parameters:
+            queries : Numpy Array (M, 3) of query points
+            radius (float) : Search radius
+
+        Returns:
+            (indices, offsets) : Compressed neighbor lists. Neighbors of query i
+                are indices[offsets[i]:offsets[i+1]], in no particular order
+        """
+        queries = np.asarray(queries, dtype = np.float64).reshape(-1, 3)
+        ring = int(np.ceil(radius / self.cell_size))
+        indices = []
+        counts = np.zeros(len(queries), dtype = np.int64)
+
+        if self.num_points == 0:
+            return (np.zeros(0, dtype = np.int64), np.zeros(len(queries) + 1, dtype = np.int64))
+
+        chunk_size = self._query_chunk_size(ring)
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start:start + chunk_size]
+            (query_ids, positions) = self._gather_candidates(chunk, ring)
+            distances = self._squared_distances(chunk, query_ids, positions)
+            inside = distances <= radius * radius
+            (query_ids, positions, distances) = (query_ids[inside], positions[inside], distances[inside])
+
+            # Candidates are already grouped by query
+            indices.append(self.order[positions])
+            counts[start:start + len(chunk)] = np.bincount(query_ids, minlength = len(chunk))
+
+        offsets = np.zeros(len(queries) + 1, dtype = np.int64)
+        np.cumsum(counts, out = offsets[1:])
+        if indices:
+            indices = np.concatenate(indices)
+        else:
+            indices = np.zeros(0, dtype = np.int64)
+
+        return (indices, offsets)
+
+
+    def query_knn(self, queries, k):
+        """
+        Find k nearest points of each query point
+
+        Parameters:
+            queries : Numpy Array (M, 3) of query points
+            k (int) : Number of neighbors
+
+        Returns:
+            (indices, distances) : Numpy Arrays (M, k) of point indices and
+                distances sorted by distance. Missing neighbors (fewer than k
+                points in the index) have index -1 and distance inf
+        """
+        queries = np.asarray(queries, dtype = np.float64).reshape(-1, 3)
+        indices = np.full((len(queries), k), -1, dtype = np.int64)
+        distances = np.full((len(queries), k), np.inf)
+        if self.num_points == 0 or k < 1:
+            return (indices, distances)
+
+        pending = np.arange(len(queries))
+        ring = 1
+
+        while len(pending) > 0:
+            done = np.zeros(len(pending), dtype = bool)
+            chunk_size = self._query_chunk_size(ring)
+
+            for start in range(0, len(pending), chunk_size):
+                rows = pending[start:start + chunk_size]
+                chunk = queries[rows]
+                (query_ids, positions) = self._gather_candidates(chunk, ring)
+                squared = self._squared_distances(chunk, query_ids, positions)
+
+                # Candidates are grouped by query, scatter them into a padded
+                # (queries, candidates) matrix and select the k smallest per row
+                group_counts = np.bincount(query_ids, minlength = len(chunk))
+                group_starts = np.cumsum(group_counts) - group_counts
+                column = np.arange(len(query_ids)) - group_starts[query_ids]
+                width = max(k, int(np.max(group_counts)))
+                matrix = np.full((len(chunk), width), np.inf)
+                matrix.ravel()[query_ids * width + column] = squared
+                nearest = np.argpartition(matrix, k - 1, axis = 1)[:, :k]
+                nearest_squared = np.take_along_axis(matrix, nearest, axis = 1)
+                order = np.argsort(nearest_squared, axis = 1)
+                nearest = np.take_along_axis(nearest, order, axis = 1)
+                nearest_squared = np.take_along_axis(nearest_squared, order, axis = 1)
+
+                # Result is final when the k-th neighbor is inside the searched voxels,
+                # i.e. no closer point can be in a voxel outside the ring
+                if self._is_exhaustive(ring):
+                    chunk_done = np.ones(len(chunk), dtype = bool)
+                else:
+                    chunk_done = nearest_squared[:, -1] <= (ring * self.cell_size) ** 2
+
+                # Matrix column back to sorted point position
+                found = np.isfinite(nearest_squared) & chunk_done[:, np.newaxis]
+                (done_rows, ranks) = np.nonzero(found)
+                positions = positions[group_starts[done_rows] + nearest[done_rows, ranks]]
+                indices[rows[done_rows], ranks] = self.order[positions]
+                distances[rows[done_rows], ranks] = np.sqrt(nearest_squared[done_rows, ranks])
+                done[start:start + len(chunk)] = chunk_done
+
+            pending = pending[~done]
+            ring *= 2
+
+        return (indices, distances)
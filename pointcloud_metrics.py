@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud I/O Metrics
+
+    Per-call metrics of PointCloud file reads and writes: header parse
+    time, payload time, bytes read or written, points decoded, copies of
+    the point data and optionally peak allocation. Metrics are collected
+    only while a MetricsCollector is active, otherwise the I/O functions
+    skip them with a single check.
+
+    Usage:
+        with MetricsCollector() as collector:
+            point_cloud.read_pcd_file("lidar.pcd")
+        print(collector.records[0].as_dict())
+
+    Author: Jari Honkanen
+
+"""
+
+import time
+import tracemalloc
+
+# Active collectors, every I/O call is reported to all of them
+active_collectors = []
+
+
+class IOMetrics:
+    """ Metrics of one PointCloud I/O call """
+
+    def __init__(self, operation, file_name):
+        self.operation = operation
+        self.file_name = file_name
+        self.file_type = None
+        self.header_seconds = 0.0
+        self.payload_seconds = 0.0
+        self.total_seconds = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.points_decoded = 0
+        # Full copies of the point data made after decoding
+        self.copies = 0
+        # Peak traced allocation during the call above the allocation at its
+        # start. None unless a collector traces memory and started tracemalloc
+        # itself, only then the tracemalloc peak is reset for the call
+        self.peak_allocation_bytes = None
+        # repr() of the exception of a failed call, None for a successful call
+        self.error = None
+        self.start_time = time.perf_counter()
+        self.stage_time = self.start_time
+        self.start_allocation = None
+        if any(collector.started_tracing for collector in active_collectors) and tracemalloc.is_tracing():
+            # Tracing is owned by a collector, no other user depends on the peak
+            tracemalloc.reset_peak()
+            self.start_allocation = tracemalloc.get_traced_memory()[0]
+
+
+    def end_header(self):
+        """ Mark end of the header stage """
+        now = time.perf_counter()
+        self.header_seconds += now - self.stage_time
+        self.stage_time = now
+
+
+    def end_payload(self):
+        """ Mark end of the payload stage """
+        now = time.perf_counter()
+        self.payload_seconds += now - self.stage_time
+        self.stage_time = now
+
+
+    def skip_stage(self):
+        """ Restart stage timing, time since the end of the last stage is not counted """
+        self.stage_time = time.perf_counter()
+
+
+    def finish(self):
+        """ Complete the metrics and report them to the active collectors """
+        # Wall time of the call, for generators including time spent by the consumer
+        self.total_seconds = time.perf_counter() - self.start_time
+        if self.start_allocation is not None and tracemalloc.is_tracing():
+            self.peak_allocation_bytes = max(0, tracemalloc.get_traced_memory()[1] - self.start_allocation)
+
+        for collector in list(active_collectors):
+            collector.record(self)
+
+
+    def as_dict(self):
+        """ Return metrics as a dictionary """
+        return {
+            "operation": self.operation,
+            "file_name": self.file_name,
+            "file_type": self.file_type,
+            "header_seconds": self.header_seconds,
+            "payload_seconds": self.payload_seconds,
+            "total_seconds": self.total_seconds,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "points_decoded": self.points_decoded,
+            "copies": self.copies,
+            "peak_allocation_bytes": self.peak_allocation_bytes,
+            "error": self.error,
+        }
+
+
+def start_metrics(operation, file_name):
+    """
+    Start metrics of an I/O call
+
+    Parameters:
+        operation (string) : Name of the PointCloud method
+        file_name (string) : Name and Path to the file
+
+    Returns:
+        IOMetrics, or None when no collector is active
+    """
+    if not active_collectors:
+        return None
+
+    return IOMetrics(operation, file_name)
+
+
+class MetricsCollector:
+    """ Collects metrics of PointCloud I/O calls while active """
+
+    def __init__(self, hook = None, trace_memory = False, keep_records = True):
+        """
+        Parameters:
+            hook : Function called with the IOMetrics of every call, optional
+            trace_memory (bool) : Measure peak allocation with tracemalloc.
+                Tracing slows down Python allocations and measures
+                allocations of all threads. When tracemalloc is already
+                tracing, peaks are not measured, as resetting the peak for
+                each call would disturb the other user
+            keep_records (bool) : Keep IOMetrics of all calls in self.records
+        """
+        self.hook = hook
+        self.trace_memory = trace_memory
+        self.keep_records = keep_records
+        self.records = []
+        self.started_tracing = False
+
+
+    def start(self):
+        """ Start collecting """
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        active_collectors.append(self)
+
+
+    def stop(self):
+        """ Stop collecting """
+        if self in active_collectors:
+            active_collectors.remove(self)
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+    def record(self, metrics):
+        """ Record metrics of one call """
+        if self.keep_records:
+            self.records.append(metrics)
+        if self.hook is not None:
+            self.hook(metrics)
+
+
+    def summary(self):
+        """
+        Sum recorded metrics per operation
+
+        Returns:
+            dict of operation name to dict of call count, failed call count and summed metrics
+        """
+        totals = {}
+        for metrics in self.records:
+            total = totals.setdefault(metrics.operation, { "calls": 0, "errors": 0, "header_seconds": 0.0,
+                "payload_seconds": 0.0, "total_seconds": 0.0, "bytes_read": 0, "bytes_written": 0,
+                "points_decoded": 0, "copies": 0 })
+            total["calls"] += 1
+            total["errors"] += metrics.error is not None
+            for name in list(total)[2:]:
+                total[name] += getattr(metrics, name)
+
+        return totals
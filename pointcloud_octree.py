@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Octree
+
+    Octree level-of-detail hierarchy for progressive rendering of large
+    point clouds. Every node holds a random subsample of the points in its
+    cube, so drawing the nodes of the first levels gives a coarse but
+    complete view of the cloud and deeper nodes add detail. Nodes are
+    selected by their distance to the camera within a point budget.
+
+    Author: Jari Honkanen
+
+"""
+
+import hashlib
+import heapq
+import os
+import numpy as np
+
+
+class PointCloudOctree:
+    """ Octree level-of-detail structure over an (N, 3) array of points """
+
+    def __init__(self, points = None, max_points_per_node = 5000, max_depth = 10, seed = 0):
+        """
+        Build octree
+
+        Parameters:
+            points : Numpy Array (N, 3) of points, None for an empty octree to be loaded
+            max_points_per_node (int) : Number of points stored in each node, except leaves
+            max_depth (int) : Depth of the deepest level, root is level 0
+            seed (int) : Seed of the random subsampling
+        """
+        self.max_points_per_node = max_points_per_node
+        self.max_depth = max_depth
+        self.points = np.zeros((0, 3), dtype = np.float32)
+        self.origin = np.zeros(3)
+        self.size = 1.0
+        # Nodes, in level order
+        self.node_level = np.zeros(0, dtype = np.int64)
+        self.node_coords = np.zeros((0, 3), dtype = np.int64)
+        self.node_start = np.zeros(0, dtype = np.int64)
+        self.node_count = np.zeros(0, dtype = np.int64)
+        self.node_children = []
+        # Point indices of all nodes, node i owns point_index[node_start[i]:node_start[i] + node_count[i]]
+        self.point_index = np.zeros(0, dtype = np.int64)
+
+        if points is not None:
+            self.build(points, seed)
+
+
+    def build(self, points, seed = 0):
+        """
+        Build octree over points
+
+        Parameters:
+            points : Numpy Array (N, 3) of points
+            seed (int) : Seed of the random subsampling
+        """
+        self.points = np.asarray(points)[:, :3]
+        num_points = len(self.points)
+        if num_points > 0:
+            lower = np.min(self.points, axis = 0).astype(np.float64)
+            upper = np.max(self.points, axis = 0).astype(np.float64)
+        else:
+            lower = np.zeros(3)
+            upper = np.ones(3)
+        self.origin = lower
+        self.size = max(float(np.max(upper - lower)), 1e-9) * (1.0 + 1e-9)
+
+        # Random order, so that the first points of each node are a uniform subsample
+        rng = np.random.default_rng(seed)
+        remaining = rng.permutation(num_points)
+
+        levels = []
+        coords = []
+        starts = []
+        counts = []
+        point_index = []
+        num_assigned = 0
+
+        for level in range(self.max_depth + 1):
+            if len(remaining) == 0:
+                break
+
+            cells = 1 << level
+            node_xyz = np.floor((self.points[remaining] - self.origin) * (cells / self.size)).astype(np.int64)
+            node_xyz = np.clip(node_xyz, 0, cells - 1)
+            keys = (node_xyz[:, 0] * cells + node_xyz[:, 1]) * cells + node_xyz[:, 2]
+
+            # Stable sort keeps the random order inside each node
+            order = np.argsort(keys, kind = "stable")
+            sorted_keys = keys[order]
+            node_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            node_sizes = np.diff(np.r_[node_starts, len(keys)])
+            rank = np.arange(len(keys)) - np.repeat(node_starts, node_sizes)
+
+            # Leaves keep all remaining points
+            if level == self.max_depth:
+                keep = np.ones(len(keys), dtype = bool)
+                kept_counts = node_sizes
+            else:
+                keep = rank < self.max_points_per_node
+                kept_counts = np.minimum(node_sizes, self.max_points_per_node)
+
+            kept = order[keep]
+
+            levels.append(np.full(len(node_starts), level, dtype = np.int64))
+            coords.append(node_xyz[order[node_starts]])
+            starts.append(num_assigned + np.cumsum(kept_counts) - kept_counts)
+            counts.append(kept_counts)
+            point_index.append(remaining[kept])
+            num_assigned += len(kept)
+
+            remaining = remaining[order[~keep]]
+
+        if levels:
+            self.node_level = np.concatenate(levels)
+            self.node_coords = np.concatenate(coords)
+            self.node_start = np.concatenate(starts)
+            self.node_count = np.concatenate(counts)
+            self.point_index = np.concatenate(point_index)
+        self._link_children()
+
+
+    def _link_children(self):
+        """ Find child nodes of every node from the node coordinates """
+
+        self.node_children = [[] for i in range(len(self.node_level))]
+        node_ids = {}
+        for (node, (level, coords)) in enumerate(zip(self.node_level.tolist(), self.node_coords.tolist())):
+            node_ids[(level, coords[0], coords[1], coords[2])] = node
+            if level > 0:
+                parent = node_ids.get((level - 1, coords[0] >> 1, coords[1] >> 1, coords[2] >> 1))
+                if parent is not None:
+                    self.node_children[parent].append(node)
+
+
+    def node_points(self, node):
+        """ Return point indices stored in a node """
+        start = self.node_start[node]
+        return self.point_index[start:start + self.node_count[node]]
+
+
+    def select(self, camera_position, point_budget = 1000000, detail = 1.0):
+        """
+        Select point indices to render for a camera position
+
+        Nodes are visited from the root, nodes that appear largest from the
+        camera (node size divided by distance) first, until the point budget
+        is used.
+
+        Parameters:
+            camera_position : Camera position (x, y, z)
+            point_budget (int) : Maximum number of points to select
+            detail (float) : Nodes smaller than detail / 1000 of the view
+                distance are not refined further
+
+        Returns:
+            Numpy Array of point indices
+        """
+        if len(self.node_level) == 0:
+            return np.zeros(0, dtype = np.int64)
+
+        camera_position = np.asarray(camera_position, dtype = np.float64)
+        node_sizes = self.size / (1 << self.node_level)
+        centers = self.origin + (self.node_coords + 0.5) * node_sizes[:, np.newaxis]
+        distances = np.maximum(np.linalg.norm(centers - camera_position, axis = 1), 1e-9)
+        priorities = node_sizes / distances
+
+        selected = []
+        num_selected = 0
+        heap = [(-priorities[0], 0)]
+        while heap:
+            (priority, node) = heapq.heappop(heap)
+            if num_selected + self.node_count[node] > point_budget:
+                continue
+            selected.append(node)
+            num_selected += self.node_count[node]
+            for child in self.node_children[node]:
+                if priorities[child] * 1000.0 >= 1.0 / detail:
+                    heapq.heappush(heap, (-priorities[child], child))
+
+        if not selected:
+            # Root node alone is larger than the budget, its points are in
+            # random order so the first ones are a uniform subsample
+            return self.node_points(0)[:point_budget].copy()
+
+        return np.concatenate([self.node_points(node) for node in selected])
+
+
+    def save(self, file_name):
+        """
+        Save octree into a NumPy .npz file
+
+        Parameters:
+            file_name (string) : Name and Path to the file to be written
+        """
+        np.savez(file_name, points = self.points, origin = self.origin, size = self.size,
+            max_points_per_node = self.max_points_per_node, max_depth = self.max_depth,
+            node_level = self.node_level, node_coords = self.node_coords, node_start = self.node_start,
+            node_count = self.node_count, point_index = self.point_index)
+
+
+    @staticmethod
+    def load(file_name):
+        """
+        Load octree from a NumPy .npz file written by save()
+
+        Parameters:
+            file_name (string) : Name and Path to the file to be read
+
+        Returns:
+            PointCloudOctree
+        """
+        octree = PointCloudOctree()
+        with np.load(file_name) as data:
+            octree.points = data["points"]
+            octree.origin = data["origin"]
+            octree.size = float(data["size"])
+            octree.max_points_per_node = int(data["max_points_per_node"])
+            octree.max_depth = int(data["max_depth"])
+            octree.node_level = data["node_level"]
+            octree.node_coords = data["node_coords"]
+            octree.node_start = data["node_start"]
+            octree.node_count = data["node_count"]
+            octree.point_index = data["point_index"]
+        octree._link_children()
+
+        return octree
+
+
+def get_octree(points, cache_prefix = "octree", max_points_per_node = 5000, max_depth = 10, seed = 0):
+    """
+    Load octree from a cache file, or build it and save it into the cache file
+
+    The cache file name contains a hash of the points and the build
+    parameters, so changed points or parameters build a new octree.
+
+    Parameters:
+        points : Numpy Array (N, 3) of points
+        cache_prefix (string) : Path and start of the cache file name
+        max_points_per_node, max_depth, seed : Build parameters, see PointCloudOctree
+
+    Returns:
+        PointCloudOctree
+    """
+    points = np.ascontiguousarray(np.asarray(points)[:, :3])
+    digest = hashlib.sha1()
+    digest.update(repr((points.shape, points.dtype.str, max_points_per_node, max_depth, seed)).encode("utf-8"))
+    digest.update(points.data)
+    octree_file = cache_prefix + "_" + digest.hexdigest()[:16] + ".npz"
+
+    if os.path.exists(octree_file):
+        return PointCloudOctree.load(octree_file)
+
+    octree = PointCloudOctree(points, max_points_per_node, max_depth, seed)
+    octree.save(octree_file)
+
+    return octree
+
+
+def render_octree(octree, point_budget = 1000000, scalars = None, **kwargs):
+    """
+    Render octree with PyVista, refining the selected nodes when the camera moves
+
+    Parameters:
+        octree (PointCloudOctree) : Octree to be rendered
+        point_budget (int) : Maximum number of points drawn at once
+        scalars : Numpy Array (N,) of scalars of all points, optional
+        kwargs : Additional arguments for pyvista.Plotter.add_mesh
+    """
+    import pyvista as pv
+
+    plotter = pv.Plotter()
+
+    def update(*args):
+        indices = octree.select(plotter.camera_position[0], point_budget)
+        mesh = pv.PolyData(octree.points[indices])
+        if scalars is not None:
+            mesh["scalars"] = scalars[indices]
+        plotter.add_mesh(mesh, name = "octree_lod", reset_camera = False, **kwargs)
+
+    # Initial view of the root node subsample, then refine for the camera position
+    plotter.add_mesh(pv.PolyData(octree.points[octree.node_points(0)]), name = "octree_lod", **kwargs)
+    plotter.reset_camera()
+    update()
+    plotter.iren.add_observer("EndInteractionEvent", update)
+    plotter.show()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Quantization
+
+    Quantized storage of point fields as integers with a per-field scale
+    and offset, as in LAS files: value = integer * scale + offset.
+    Coordinates are stored as int16 or int32 and intensity as uint8 or
+    uint16. Quantized fields are dequantized to float32, or lazily with
+    DequantizedView, which converts only the rows that are accessed.
+
+    Author: Jari Honkanen
+
+"""
+
+import numpy as np
+
+
+class DequantizedView:
+    """ Read-only float32 view of quantized values, dequantized on access """
+
+    def __init__(self, values, scales, offsets):
+        """
+        Parameters:
+            values : Numpy Array (N,) or (N, C) of quantized integers
+            scales : Scale of the values, scalar or one per column
+            offsets : Offset of the values, scalar or one per column
+        """
+        self.values = values
+        self.scales = np.asarray(scales, dtype = np.float64)
+        self.offsets = np.asarray(offsets, dtype = np.float64)
+
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+
+    @property
+    def ndim(self):
+        return self.values.ndim
+
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32)
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def _dequantize(self, values):
+        """ Convert quantized rows to float32 """
+        # float64 arithmetic keeps the precision of int32 values with large offsets
+        return (values * self.scales + self.offsets).astype(np.float32)
+
+
+    def __getitem__(self, key):
+        """ Dequantize the selected rows, then select columns """
+        if not isinstance(key, tuple):
+            key = (key,)
+        rows = self.values[key[0]]
+        dequantized = self._dequantize(rows)
+        if len(key) == 1:
+            return dequantized
+        if rows.ndim == self.values.ndim:
+            return dequantized[(slice(None),) + key[1:]]
+
+        return dequantized[key[1:]]
+
+
+    def __array__(self, dtype = None, copy = None):
+        dequantized = self._dequantize(self.values)
+        if dtype is not None:
+            dequantized = dequantized.astype(dtype)
+
+        return dequantized
+
+
+def get_quantization(values, precision = None, quantized_type = np.int32, value_range = None):
+    """
+    Choose scale and offset for quantizing values
+
+    With a precision the scale is the precision and the offset is the
+    middle of the value range, rounded to the precision. Without a
+    precision the value range is spread over the whole integer range.
+
+    Parameters:
+        values : Numpy Array of the values
+        precision (float) : Quantization step, None to use the full integer range
+        quantized_type : Integer type of the quantized values
+        value_range : (min, max) of the values, None to use the range of values
+
+    Returns:
+        (scale, offset) : floats
+
+    Exceptions:
+        ValueError: if the values do not fit the integer type at the precision
+    """
+    info = np.iinfo(quantized_type)
+    if value_range is None:
+        value_range = (float(np.min(values)), float(np.max(values))) if np.size(values) > 0 else (0.0, 0.0)
+    (lower, upper) = (float(value_range[0]), float(value_range[1]))
+
+    if precision is None:
+        scale = (upper - lower) / (float(info.max) - float(info.min)) if upper > lower else 1.0
+        offset = lower - float(info.min) * scale
+        return (scale, offset)
+
+    scale = float(precision)
+    if info.min < 0:
+        offset = round((lower + upper) / 2.0 / scale) * scale
+    else:
+        offset = np.floor(lower / scale) * scale
+    if (upper - offset) / scale > info.max + 0.5 or (lower - offset) / scale < info.min - 0.5:
+        raise ValueError("Values do not fit " + np.dtype(quantized_type).name + " at precision " + str(precision))
+
+    return (scale, offset)
+
+
+def quantize_values(values, scale, offset, quantized_type = np.int32):
+    """
+    Quantize values to integers
+
+    Parameters:
+        values : Numpy Array of the values
+        scale (float) : Quantization step
+        offset (float) : Value of the integer zero
+        quantized_type : Integer type of the quantized values
+
+    Returns:
+        Numpy Array of quantized_type, values outside the integer range are clipped
+    """
+    info = np.iinfo(quantized_type)
+    quantized = np.rint((np.asarray(values, dtype = np.float64) - offset) / scale)
+
+    return np.clip(quantized, info.min, info.max).astype(quantized_type)
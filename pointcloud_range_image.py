@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Range Image
+
+    Spherical projection of unorganized LiDAR scans, such as KITTI
+    velodyne files, into a range image. Rows are elevation angles and
+    columns are azimuth angles. The index map stores which point is shown
+    in each pixel, so neighbors of a point can be looked up in the image
+    grid instead of searched in a tree.
+
+    Author: Jari Honkanen
+
+"""
+
+import numpy as np
+from pointcloud_filters import get_points
+
+# Vertical field of view of the Velodyne HDL-64E used in KITTI, in degrees
+KITTI_FOV_UP = 3.0
+KITTI_FOV_DOWN = -25.0
+
+
+def get_spherical_pixels(points, height = 64, width = 2048, fov_up = KITTI_FOV_UP, fov_down = KITTI_FOV_DOWN):
+    """
+    Project points to range image pixels
+
+    Parameters:
+        points : Numpy Array (N, 3) of points, sensor at the origin
+        height (int) : Number of image rows
+        width (int) : Number of image columns, covering 360 degrees of azimuth
+        fov_up (float) : Elevation of the top row edge in degrees
+        fov_down (float) : Elevation of the bottom row edge in degrees
+
+    Returns:
+        (rows, cols, ranges) : Numpy Arrays (N,) of pixel row, pixel column
+            and distance of every point. Points outside the field of view
+            are clamped to the top or bottom row
+    """
+    points = np.asarray(points)[:, :3].astype(np.float64)
+    ranges = np.linalg.norm(points, axis = 1)
+
+    azimuth = np.arctan2(points[:, 1], points[:, 0])
+    elevation = np.arcsin(np.clip(points[:, 2] / np.maximum(ranges, 1e-12), -1.0, 1.0))
+
+    # Column 0 looks backwards, the forward direction is in the middle of the image
+    cols = np.floor((0.5 * (1.0 - azimuth / np.pi)) * width).astype(np.int64) % width
+    fov_up = np.radians(fov_up)
+    fov_down = np.radians(fov_down)
+    rows = np.floor((fov_up - elevation) / (fov_up - fov_down) * height).astype(np.int64)
+    rows = np.clip(rows, 0, height - 1)
+
+    return (rows, cols, ranges)
+
+
+def spherical_projection(point_cloud, height = 64, width = 2048, fov_up = KITTI_FOV_UP, fov_down = KITTI_FOV_DOWN):
+    """
+    Project point cloud into a range image
+
+    When several points fall into the same pixel, the closest point is shown.
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        height, width, fov_up, fov_down : Image size and field of view, see get_spherical_pixels
+
+    Returns:
+        (range_image, index_map, rows, cols) : Numpy Array (height, width) of
+            float32 ranges, -1 for empty pixels, Numpy Array (height, width)
+            of the index of the point shown in each pixel, -1 for empty
+            pixels, and Numpy Arrays (N,) of the pixel row and column of
+            every point
+    """
+    points = get_points(point_cloud)
+    (rows, cols, ranges) = get_spherical_pixels(points, height, width, fov_up, fov_down)
+
+    # Closest point first within each pixel
+    pixels = rows * width + cols
+    order = np.lexsort((ranges, pixels))
+    sorted_pixels = pixels[order]
+    first = order[np.r_[True, sorted_pixels[1:] != sorted_pixels[:-1]]] if len(order) > 0 else order
+
+    index_map = np.full(height * width, -1, dtype = np.int64)
+    index_map[pixels[first]] = first
+    range_image = np.full(height * width, -1.0, dtype = np.float32)
+    range_image[pixels[first]] = ranges[first]
+
+    return (range_image.reshape(height, width), index_map.reshape(height, width), rows, cols)
+
+
+def get_image_values(index_map, values, fill = 0):
+    """
+    Create image of point values, for example intensity, from an index map
+
+    Parameters:
+        index_map : Numpy Array (H, W) of point indices, -1 for empty pixels
+        values : Numpy Array (N, ...) of point values
+        fill : Value of empty pixels
+
+    Returns:
+        Numpy Array (H, W, ...) of values
+    """
+    values = np.asarray(values)
+    image = np.full(index_map.shape + values.shape[1:], fill, dtype = values.dtype)
+    valid = index_map >= 0
+    image[valid] = values[index_map[valid]]
+
+    return image
+
+
+def get_pixel_neighbors(index_map, rows, cols, size = 3):
+    """
+    Get points in the size x size pixel window around each point
+
+    Columns wrap around, as the image covers the full azimuth circle.
+
+    Parameters:
+        index_map : Numpy Array (H, W) of point indices, -1 for empty pixels
+        rows, cols : Numpy Arrays (N,) of pixel row and column of the points
+        size (int) : Odd window size
+
+    Returns:
+        Numpy Array (N, size * size) of neighbor point indices, -1 for empty
+        or out of image pixels. The point itself is included when it is the
+        point shown in its pixel
+    """
+    (height, width) = index_map.shape
+    half = size // 2
+    offsets = np.arange(-half, half + 1)
+    neighbor_rows = rows[:, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]
+    neighbor_cols = (cols[:, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]) % width
+    neighbor_rows = np.broadcast_to(neighbor_rows, (len(rows), size, size))
+
+    inside = (neighbor_rows >= 0) & (neighbor_rows < height)
+    neighbors = index_map[np.clip(neighbor_rows, 0, height - 1), neighbor_cols]
+    neighbors = np.where(inside, neighbors, -1)
+
+    return neighbors.reshape(len(rows), size * size)
@@ -8,90 +8,9 @@
 """
 
 import numpy as np
-import math
 import pyvista as pv
-from pyvista import examples
+from pointcloud_shapes import create_box_points, create_torus_points
 
-def get_example_point_cloud(decimateFactor = 0.05):
-    """ Create numpy array of points from PyVista LiDAR example """
-    
-    # Get PyVista Lidar Example Data
-    print("Downloading PyVista LiDAR Example data ...")
-    dataset = examples.download_lidar()
-    print(f"Downloading complete. Downloaded {dataset.n_points} points")
-    print(f"Data type {type(dataset)}")
-    # Get random points from the dataset
-    pointIds = np.random.randint(low=0, high=dataset.n_points-1, size=int(dataset.n_points * decimateFactor) )
-    print(f"Number of points after decimation: {len(pointIds)}")
-
-    return dataset.points[pointIds]
-
-
-def create_ellipse_points(radius=0.5, height=2.0, step=0.05, x_pos=0.0, y_pos=0.0, z_pos=0.0):
-    """ Create an ellipse shape points array
-    """
-    points_array = []
-
-    z_range = abs(height/2)
-
-    for z in np.arange(-z_range, z_range, step):
-
-        for angle in np.arange(0.0, 2*math.pi, step):
-    
-            x = radius * math.cos(angle)
-            y = math.sin(angle)
-            point = [x + x_pos, y + y_pos, z + z_pos]
-
-            points_array.append(point)
-
-    return np.array(points_array)
-
-
-def create_torus_points(torus_radius=1.0, tube_radius=0.4, step=0.05, x_pos=0.0, y_pos=0.0, z_pos=0.0):
-    """ Create an trous shape points array
-    """
-    points_array = []
-
-    for theta in np.arange(0.0, 2*math.pi, step):
-
-        for phi in np.arange(0.0, 2*math.pi, step):
-    
-            x = (torus_radius + tube_radius * math.cos(theta))*math.cos(phi)
-            z = (torus_radius + tube_radius * math.cos(theta))*math.sin(phi)
-            y = tube_radius*math.sin(theta)
-            point = [x + x_pos, y + y_pos, z + z_pos]
-
-            points_array.append(point)
-
-    return np.array(points_array)
-
-
-
-def create_box_points(x_size=1.0, y_size=1.0, z_size=1.0, step=0.05, x_pos=0.0, y_pos=0.0, z_pos=0.0):
-    """ Create an box shape points array 
-    """
-    points_array = []
-
-    for z in [0, z_size]:
-        for x in np.arange(0.0, x_size, step):
-            for y in np.arange(0.0, y_size, step):
-                point = [x + x_pos, y + y_pos, z + z_pos]
-                points_array.append(point)
-
-    for y in [0, y_size]:
-        for x in np.arange(0, x_size, step):
-            for z in np.arange(0, z_size, step):
-                point = [x + x_pos, y + y_pos, z + z_pos]
-                points_array.append(point)
-
-    for x in [0, x_size]:
-        for y in np.arange(0.0, y_size, step):
-            for z in np.arange(0.0, z_size, step):
-                point = [x + x_pos, y + y_pos, z + z_pos]
-                points_array.append(point)
-
-    return np.array(points_array)
- 
 
 def create_car_sedan_points(x_size=4.1, y_size=1.8, z_size=1.5, step=0.05, x_pos=0.0, y_pos=0.0, z_pos=0.0):
     # Typical Sedan
@@ -100,13 +19,13 @@ def create_car_sedan_points(x_size=4.1, y_size=1.8, z_size=1.5, step=0.05, x_pos
     body_lower = create_box_points(x_size, y_size, 0.5*z_size, step, x_pos, y_pos, z_pos)
     body_upper = create_box_points(0.5*x_size, 0.9*y_size, 0.5*z_size, step, x_pos + 0.25*x_size, y_pos + 0.05*y_size, z_pos + 0.5*z_size)
     wheel_rr = create_torus_points(torus_radius=0.15*z_size, tube_radius=0.05*z_size, step=2*step,
-        x_pos=x_pos + 0.2*x_size, y_pos=y_pos, z_pos=z_pos)
+        x_offset=x_pos + 0.2*x_size, y_offset=y_pos, z_offset=z_pos)
     wheel_rf = create_torus_points(torus_radius=0.15*z_size, tube_radius=0.05*z_size, step=2*step,
-        x_pos=x_pos + 0.8*x_size, y_pos=y_pos, z_pos=z_pos)  
+        x_offset=x_pos + 0.8*x_size, y_offset=y_pos, z_offset=z_pos)  
     wheel_lr = create_torus_points(torus_radius=0.15*z_size, tube_radius=0.05*z_size, step=2*step,
-        x_pos=x_pos + 0.2*x_size, y_pos=y_pos + y_size, z_pos=z_pos)
+        x_offset=x_pos + 0.2*x_size, y_offset=y_pos + y_size, z_offset=z_pos)
     wheel_lf = create_torus_points(torus_radius=0.15*z_size, tube_radius=0.05*z_size, step=2*step,
-        x_pos=x_pos + 0.8*x_size, y_pos=y_pos + y_size, z_pos=z_pos)            
+        x_offset=x_pos + 0.8*x_size, y_offset=y_pos + y_size, z_offset=z_pos)            
 
     car = np.concatenate((body_lower, body_upper, wheel_rr, wheel_rf, wheel_lr, wheel_lf), axis=0)
 
@@ -117,6 +36,10 @@ def create_car_sedan_points(x_size=4.1, y_size=1.8, z_size=1.5, step=0.05, x_pos
 
 class Car:
     """ Simple Car Point Cloud Class """
+
+    # Canonical car points at the origin, keyed by (x_size, y_size, z_size, step)
+    templates = {}
+
     def __init__(self, x_size=4.1, y_size=1.8, z_size=1.5, step=0.05):
         self.x_size = x_size
         self.y_size = y_size
@@ -129,18 +52,60 @@ class Car:
         self.z_size = z_size
         self.step = step
 
+    def getTemplate(self):
+        """ Return cached car points at the origin for the current size and step """
+        key = (self.x_size, self.y_size, self.z_size, self.step)
+        template = Car.templates.get(key)
+        if template is None:
+            template = create_car_sedan_points(self.x_size, self.y_size, self.z_size, self.step)
+            template.setflags(write=False)
+            Car.templates[key] = template
+        return template
+
     def spawn(self, x_pos = 0.0, y_pos=0.0, z_pos=0.0):
-        return create_car_sedan_points(self.x_size, self.y_size, self.z_size, self.step, x_pos, y_pos, z_pos)
+        return self.getTemplate() + np.array([x_pos, y_pos, z_pos])
+
+    def spawn_many(self, positions, yaws=None, dtype=np.float64):
+        """ Spawn many cars with a single broadcasted transform
+
+        Parameters:
+            positions : Array (M, 3) of car positions, as in spawn()
+            yaws : Array (M,) of rotations around the vertical axis through the
+                center of the car footprint in radians, None for no rotation
+            dtype : Data type of the output array, np.float32 halves the memory use
+
+        Returns:
+            points_array : Numpy Array (M*N, 4) of x, y, z and car instance id
+        """
+        template = self.getTemplate()
+        positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        num_cars = len(positions)
+        if yaws is None:
+            yaws = np.zeros(num_cars)
+        yaws = np.asarray(yaws, dtype=float).reshape(num_cars)
+
+        cos_yaw = np.cos(yaws)[:, np.newaxis]
+        sin_yaw = np.sin(yaws)[:, np.newaxis]
+        # Template origin is a corner of the car, rotate around the footprint center
+        center = (np.min(template[:, :2], axis=0) + np.max(template[:, :2], axis=0)) / 2.0
+        x = template[:, 0] - center[0]
+        y = template[:, 1] - center[1]
+
+        points_array = np.empty((num_cars, len(template), 4), dtype=dtype)
+        points_array[:, :, 0] = cos_yaw * x - sin_yaw * y + (positions[:, 0:1] + center[0])
+        points_array[:, :, 1] = sin_yaw * x + cos_yaw * y + (positions[:, 1:2] + center[1])
+        points_array[:, :, 2] = template[:, 2] + positions[:, 2:3]
+        points_array[:, :, 3] = np.arange(num_cars)[:, np.newaxis]
+
+        return points_array.reshape(-1, 4)
 
 
 
 if __name__ == "__main__":
 
-    car1 = Car()
-    car1_points = car1.spawn()
-    car2 = Car()
-    car2_points = car2.spawn(x_pos = 5.0, y_pos = 2.5)
-    points_array = np.concatenate((car1_points, car2_points), axis=0)
+    car = Car()
+    cars = car.spawn_many(positions=[[0.0, 0.0, 0.0], [5.0, 2.5, 0.0]], yaws=[0.0, 0.0])
+    points_array = cars[:, :3]
 
     # Create PyVista Mesh
     point_cloud = pv.PolyData(points_array)
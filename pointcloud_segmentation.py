@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Segmentation
+
+    Plane segmentation with batched RANSAC. All plane hypotheses are
+    built and scored at once with NumPy matrix operations on a random
+    subsample of the points, then the best plane is refined with a least
+    squares fit to its inliers. Typical use is ground removal of LiDAR
+    scans.
+
+    Author: Jari Honkanen
+
+"""
+
+import numpy as np
+from pointcloud_filters import get_points
+
+
+def fit_plane(points):
+    """
+    Least squares plane through points
+
+    Parameters:
+        points : Numpy Array (N, 3) of points, N >= 3
+
+    Returns:
+        Numpy Array (4,) plane (a, b, c, d) with unit normal (a, b, c),
+        a * x + b * y + c * z + d = 0
+    """
+    points = np.asarray(points, dtype = np.float64)
+    centroid = np.mean(points, axis = 0)
+    centered = points - centroid
+    # Normal is the direction of least variance
+    (eigenvalues, eigenvectors) = np.linalg.eigh(centered.T @ centered)
+    normal = eigenvectors[:, 0]
+
+    return np.r_[normal, -normal @ centroid]
+
+
+def get_plane_distances(points, plane):
+    """ Return unsigned distances (N,) of points to a plane with a unit normal """
+
+    # Computed in the precision of the points, without converting the cloud
+    plane = np.asarray(plane, dtype = points.dtype if points.dtype.kind == "f" else np.float64)
+    return np.abs(points[:, :3] @ plane[:3] + plane[3])
+
+
+def segment_plane(point_cloud, distance_threshold = 0.2, num_hypotheses = 256, sample_points = 4096,
+        refine_iterations = 2, axis = None, max_angle = 15.0, seed = 0):
+    """
+    Find the plane with the most inliers with batched RANSAC
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        distance_threshold (float) : Maximum distance of an inlier from the plane
+        num_hypotheses (int) : Number of random three point planes evaluated
+        sample_points (int) : Number of random points the hypotheses are
+            scored on, None to score on all points
+        refine_iterations (int) : Number of least squares refinements of the best plane
+        axis : Plane normal direction, for example (0, 0, 1) for the ground,
+            None for any direction
+        max_angle (float) : Maximum angle in degrees between the plane normal and axis
+        seed (int) : Random seed
+
+    Returns:
+        (plane, inliers) : Numpy Array (4,) plane (a, b, c, d) with unit
+            normal, None if no plane was found, and boolean Numpy Array (N,)
+            inlier mask
+    """
+    points = get_points(point_cloud)
+    num_points = len(points)
+    if num_points < 3:
+        return (None, np.zeros(num_points, dtype = bool))
+
+    rng = np.random.default_rng(seed)
+    if sample_points is None or sample_points >= num_points:
+        sample = np.asarray(points[:, :3], dtype = np.float64)
+    else:
+        sample = np.asarray(points[rng.integers(0, num_points, sample_points), :3], dtype = np.float64)
+
+    # Planes through three random sample points per hypothesis
+    corners = sample[rng.integers(0, len(sample), (num_hypotheses, 3))]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis = 1)
+    valid = lengths > 1e-12
+    normals[valid] /= lengths[valid, np.newaxis]
+    if axis is not None:
+        axis = np.asarray(axis, dtype = np.float64) / np.linalg.norm(axis)
+        valid &= np.abs(normals @ axis) >= np.cos(np.radians(max_angle))
+    if not np.any(valid):
+        return (None, np.zeros(num_points, dtype = bool))
+    normals = normals[valid]
+    offsets = -np.einsum("ij,ij->i", normals, corners[valid, 0])
+
+    # Inlier count of every hypothesis on the sample, one matrix product
+    scores = np.count_nonzero(np.abs(sample @ normals.T + offsets) <= distance_threshold, axis = 0)
+    best = np.argmax(scores)
+    plane = np.r_[normals[best], offsets[best]]
+
+    inliers = get_plane_distances(points, plane) <= distance_threshold
+    for i in range(refine_iterations):
+        if np.count_nonzero(inliers) < 3:
+            break
+        refined = fit_plane(points[inliers, :3])
+        if axis is not None and np.abs(refined[:3] @ axis) < np.cos(np.radians(max_angle)):
+            break
+        plane = refined
+        inliers = get_plane_distances(points, plane) <= distance_threshold
+
+    return (plane, inliers)
+
+
+def segment_ground(point_cloud, distance_threshold = 0.2, up = (0.0, 0.0, 1.0), max_angle = 15.0, **kwargs):
+    """
+    Find ground plane points of a LiDAR scan
+
+    Parameters:
+        point_cloud : PointCloud object or Numpy Array (N, 3) of points
+        distance_threshold (float) : Maximum distance of a ground point from the plane
+        up : Up direction of the sensor, (0, 0, 1) for KITTI
+        max_angle (float) : Maximum tilt of the ground plane in degrees
+        kwargs : Additional arguments for segment_plane
+
+    Returns:
+        (plane, ground) : Plane (a, b, c, d) and boolean Numpy Array (N,)
+            ground mask, use ~ground for the remaining points
+    """
+    return segment_plane(point_cloud, distance_threshold, axis = up, max_angle = max_angle, **kwargs)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+    Point Cloud Shapes
+
+    Create point clouds of simple shapes (ellipse, box, torus) with NumPy
+    broadcasting. Each shape is written into a single preallocated array.
+
+    Author: Jari Honkanen
+
+"""
+
+import numpy as np
+
+
+def create_ellipse_points(radius=0.5, height=2.0, step=0.05, x_offset=0.0, y_offset=0.0, z_offset=0.0):
+    """ Create an ellipse shape points array
+
+    Parameters:
+        radius (float) : Radius in x direction, radius in y direction is 1.0
+        height (float) : Height in z direction
+        step (float) : Step in z and angle (radians) between points
+        x_offset, y_offset, z_offset (float) : Position of the shape center
+
+    Returns:
+        points_array : Numpy Array (N, 3) of points
+    """
+    z_range = abs(height/2)
+    z_values = np.arange(-z_range, z_range, step)
+    angles = np.arange(0.0, 2*np.pi, step)
+
+    points_array = np.empty((len(z_values), len(angles), 3))
+    points_array[:, :, 0] = radius * np.cos(angles) + x_offset
+    points_array[:, :, 1] = np.sin(angles) + y_offset
+    points_array[:, :, 2] = z_values[:, np.newaxis] + z_offset
+
+    return points_array.reshape(-1, 3)
+
+
+def create_torus_points(torus_radius=1.0, tube_radius=0.4, step=0.05, x_offset=0.0, y_offset=0.0, z_offset=0.0):
+    """ Create a torus shape points array. The torus axis is along y
+
+    Parameters:
+        torus_radius (float) : Distance from the torus center to the tube center
+        tube_radius (float) : Radius of the tube
+        step (float) : Step in radians between points
+        x_offset, y_offset, z_offset (float) : Position of the shape center
+
+    Returns:
+        points_array : Numpy Array (N, 3) of points
+    """
+    thetas = np.arange(0.0, 2*np.pi, step)
+    phis = np.arange(0.0, 2*np.pi, step)
+
+    ring_radius = (torus_radius + tube_radius * np.cos(thetas))[:, np.newaxis]
+
+    points_array = np.empty((len(thetas), len(phis), 3))
+    points_array[:, :, 0] = ring_radius * np.cos(phis) + x_offset
+    points_array[:, :, 1] = (tube_radius * np.sin(thetas))[:, np.newaxis] + y_offset
+    points_array[:, :, 2] = ring_radius * np.sin(phis) + z_offset
+
+    return points_array.reshape(-1, 3)
+
+
+def create_box_points(x_size=1.0, y_size=1.0, z_size=1.0, step=0.05, x_offset=0.0, y_offset=0.0, z_offset=0.0,
+        centered=False):
+    """ Create a box shape points array
+
+    Parameters:
+        x_size, y_size, z_size (float) : Size of the box
+        step (float) : Distance between points on the box faces
+        x_offset, y_offset, z_offset (float) : Position of the box corner with
+            the smallest coordinates, or of the box center if centered is True
+        centered (bool) : Center the box on the offset position
+
+    Returns:
+        points_array : Numpy Array (N, 3) of points
+    """
+    if centered:
+        lower = np.array([-abs(x_size/2), -abs(y_size/2), -abs(z_size/2)])
+        upper = -lower
+    else:
+        lower = np.zeros(3)
+        upper = np.array([x_size, y_size, z_size], dtype=float)
+
+    ranges = [np.arange(lower[axis], upper[axis], step) for axis in range(3)]
+
+    # Pairs of faces perpendicular to z, y and x, in that order.
+    # Each face is a grid over the two other axes
+    faces = [(2, 0, 1), (1, 0, 2), (0, 1, 2)]
+    face_sizes = [len(ranges[u_axis]) * len(ranges[v_axis]) for (axis, u_axis, v_axis) in faces]
+    points_array = np.empty((2 * sum(face_sizes), 3))
+
+    start = 0
+    for ((axis, u_axis, v_axis), face_size) in zip(faces, face_sizes):
+        u_values = np.repeat(ranges[u_axis], len(ranges[v_axis]))
+        v_values = np.tile(ranges[v_axis], len(ranges[u_axis]))
+        for value in (lower[axis], upper[axis]):
+            face = points_array[start:start + face_size]
+            face[:, axis] = value
+            face[:, u_axis] = u_values
+            face[:, v_axis] = v_values
+            start += face_size
+
+    points_array += np.array([x_offset, y_offset, z_offset])
+
+    return points_array
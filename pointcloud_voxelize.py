@@ -8,73 +8,10 @@
 """
 
 import numpy as np
-import math
 import pyvista as pv
-from pyvista import examples
+from pointcloud_shapes import create_ellipse_points, create_box_points
+from pointcloud_filters import voxel_grid_filter
 
-def get_example_point_cloud(decimateFactor = 0.05):
-    """ Create numpy array of points from PyVista LiDAR example """
-    
-    # Get PyVista Lidar Example Data
-    print("Downloading PyVista LiDAR Example data ...")
-    dataset = examples.download_lidar()
-    print(f"Downloading complete. Downloaded {dataset.n_points} points")
-    print(f"Data type {type(dataset)}")
-    # Get random points from the dataset
-    pointIds = np.random.randint(low=0, high=dataset.n_points-1, size=int(dataset.n_points * decimateFactor) )
-    print(f"Number of points after decimation: {len(pointIds)}")
-
-    return dataset.points[pointIds]
-
-
-def create_ellipse_points(radius=0.5, height=2.0, step=0.05, x_offset=0.0, y_offset=0.0, z_offset=0.0):
-    """ Create an ellipse shape points array for testing
-    """
-    points_array = []
-
-    z_range = abs(height/2)
-
-    for z in np.arange(-z_range, z_range, step):
-
-        for angle in np.arange(0.0, 2*math.pi, step):
-    
-            x = radius * math.cos(angle)
-            y = math.sin(angle)
-            point = [x + x_offset, y + y_offset, z + z_offset]
-
-            points_array.append(point)
-
-    return np.array(points_array)
-
-
-def create_box_points(x_size=1.0, y_size=1.0, z_size=1.0, step=0.05, x_offset=0.0, y_offset=0.0, z_offset=0.0):
-    """ Create an box shape points array for testing
-    """
-    points_array = []
-    x_range = abs(x_size/2)
-    y_range = abs(y_size/2)
-    z_range = abs(x_size/2)
-    
-    for z in [-z_range, z_range]:
-        for x in np.arange(-x_range, x_range, step):
-            for y in np.arange(-y_range, y_range, step):
-                point = [x + x_offset, y + y_offset, z + z_offset]
-                points_array.append(point)
-
-    for y in [-y_range, y_range]:
-        for x in np.arange(-x_range, x_range, step):
-            for z in np.arange(-z_range, z_range, step):
-                point = [x + x_offset, y + y_offset, z + z_offset]
-                points_array.append(point)
-
-    for x in [-x_range, x_range]:
-        for y in np.arange(-y_range, y_range, step):
-            for z in np.arange(-z_range, z_range, step):
-                point = [x + x_offset, y + y_offset, z + z_offset]
-                points_array.append(point)
-
-    return np.array(points_array)
- 
 
 if __name__ == "__main__":
 
@@ -83,7 +20,7 @@ if __name__ == "__main__":
     points_array1 = create_ellipse_points(x_offset=1.0, y_offset=2.0, z_offset=3.0)
     print(f"Points Array1 type: {type(points_array1)}")
     print(f"Points Array1 shape: {points_array1.shape}")
-    points_array2 = create_box_points(x_size=2.0, y_size=2.0, z_size=2.0, step=0.04)
+    points_array2 = create_box_points(x_size=2.0, y_size=2.0, z_size=2.0, step=0.04, centered=True)
     print(f"Points Array2 type: {type(points_array2)}")
     print(f"Points Array2 shape: {points_array2.shape}")
 
@@ -91,6 +28,11 @@ if __name__ == "__main__":
     print(f"Points Array type: {type(points_array)}")
     print(f"Points Array shape: {points_array.shape}")
 
+    # Downsample with NumPy voxel grid filter, one centroid per occupied voxel
+    voxel_points, voxel_counts = voxel_grid_filter(points_array, voxel_size=0.05)
+    print(f"Voxel grid filtered points shape: {voxel_points.shape}")
+    print(f"Max points per voxel: {voxel_counts.max()}")
+
     # Create PyVista Meshes
     point_cloud = pv.PolyData(points_array)
 
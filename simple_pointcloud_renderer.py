@@ -6,27 +6,20 @@
 
 """
 
-import numpy as np
+import sys
 import pyvista as pv
-from pyvista import examples
-
-def get_example_point_cloud(decimateFactor = 0.05):
-    """ Create numpy array of points from PyVista LiDAR example """
-    
-    # Get PyVista Lidar Example Data
-    print("Downloading PyVista LiDAR Example data ...")
-    dataset = examples.download_lidar()
-    print(f"Downloading complete. Downloaded {dataset.n_points} points.")
-    # Get random points from the dataset
-    pointIds = np.random.randint(low=0, high=dataset.n_points-1, size=int(dataset.n_points * decimateFactor) )
-    print(f"Number of points after decimation: {len(pointIds)}")
-
-    return dataset.points[pointIds]
-
+from pointcloud_decimation import get_example_point_cloud
+from pointcloud_octree import get_octree, render_octree
 
 
 if __name__ == "__main__":
 
+    # Level-of-detail mode renders all points within a point budget
+    if "--lod" in sys.argv:
+        octree = get_octree(get_example_point_cloud(decimateFactor=1.0), cache_prefix="lidar_octree")
+        render_octree(octree, point_budget=1000000)
+        sys.exit(0)
+
     # Get points
     points_array = get_example_point_cloud()
 